@@ -26,3 +26,24 @@ def map_fn(entity: ImageType) -> ImageType:
     return result
 
 
+
+
+def map_batch_fn(batch: np.ndarray) -> np.ndarray:
+    """
+    Optional vectorized version of map_fn used by 'distortme map --batch N'
+    [ATTENTION]
+        *  Images of batch have the same shape, images of other shapes come in other batches
+        *  Function should return array or list with one result for each image of batch
+    Parameters
+    ----------
+        batch: np.ndarray
+            (N, H, W, C) array of images
+
+    Return
+    ------
+        result: np.ndarray
+            N modified images
+    """
+
+    result = batch.copy()
+    return result
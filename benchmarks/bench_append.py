@@ -0,0 +1,63 @@
+"""
+Compare 'distortme tohd5 --append' with rewriting the whole file when new images are added.
+
+    $ python -m benchmarks.bench_append --count 10000 --new 500 --size 64
+
+Folder with count images is converted once, then new images are added to the folder
+and the file is either extended with --append or written again from scratch.
+Append time should depend on number of new images, not on size of the file.
+"""
+import os
+import time
+import shutil
+import tempfile
+
+import cv2
+import typer
+import numpy as np
+
+from distortme.hdf5_options import Layout, Match
+from distortme.hdf5_utils import main_save_to_hdf5
+
+
+def write_images(folder: str, start: int, count: int, size: int) -> None:
+    rng = np.random.RandomState(start)
+    grid = np.linspace(0, 255, size, dtype=np.float32)
+    base = np.stack([np.add.outer(grid, grid) / 2] * 3, axis=-1)
+    for idx in range(start, start + count):
+        img = np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+        cv2.imwrite(os.path.join(folder, f"{idx:07d}.png"), img)
+
+
+def timed(function, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(count: int = typer.Option(10000, min=1),
+         new: int = typer.Option(500, min=1),
+         size: int = typer.Option(64, min=8),
+         layout: Layout = typer.Option(Layout.batched)) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        folder = os.path.join(tmpdir, "images")
+        os.mkdir(folder)
+        write_images(folder, 0, count, size)
+        initial = timed(main_save_to_hdf5, folder, None, layout=layout)
+        shutil.copy(f"{folder}.h5", os.path.join(tmpdir, "initial.h5"))
+
+        write_images(folder, count, new, size)
+        results = {}
+        for match in Match:
+            shutil.copy(os.path.join(tmpdir, "initial.h5"), f"{folder}.h5")
+            results[f"append --match {match.value}"] = timed(main_save_to_hdf5, folder, None, layout=layout,
+                                                             append=True, match=match)
+        results["rewrite"] = timed(main_save_to_hdf5, folder, None, layout=layout)
+
+    typer.echo(f"{'initial':<24}{initial:>8.2f} s  {count} images")
+    for name, elapsed in results.items():
+        typer.echo(f"{name:<24}{elapsed:>8.2f} s  {count + new} images")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,98 @@
+"""
+Compare per-image and batched HDF5 layouts created by 'distortme tohd5 --layout'.
+
+    $ python -m benchmarks.bench_hdf5_layout --count 20000 --size 64
+
+Measures write time, time to open file and list its content and
+throughput of reading consecutive and random batches. Rows 'reader' and
+'memmap' read batched files with HDF5Dataset, the latter from uncompressed file.
+Page cache is not dropped, run on cold cache for realistic numbers.
+"""
+import os
+import time
+import tempfile
+from functools import partial
+from typing import Callable, Sequence, Tuple
+
+import h5py
+import typer
+import numpy as np
+
+from distortme.hdf5_options import Codec, Layout, IMAGES_DATASET, NAMES_DATASET
+from distortme.hdf5_compression import Compression
+from distortme.hdf5_utils import HDF5Dataset, write_batched, write_per_image
+
+
+def make_images(count: int, size: int) -> Tuple[np.ndarray, ...]:
+    rng = np.random.RandomState(0)
+    grid = np.linspace(0, 255, size, dtype=np.float32)
+    base = np.stack([np.add.outer(grid, grid) / 2] * 3, axis=-1)
+    return tuple(np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8)
+                 for _ in range(count))
+
+
+def open_per_image(path: str) -> Callable[[Sequence[int]], np.ndarray]:
+    hf = h5py.File(path, 'r')
+    keys = sorted(key for key in hf.keys() if key.startswith("data_"))
+    return lambda ids: np.stack([hf[keys[idx]][()] for idx in ids])
+
+
+def open_batched(path: str) -> Callable[[Sequence[int]], np.ndarray]:
+    hf = h5py.File(path, 'r')
+    dataset, _ = hf[IMAGES_DATASET], hf[NAMES_DATASET][()]
+
+    def read(ids: Sequence[int]) -> np.ndarray:
+        if ids[-1] - ids[0] + 1 == len(ids):
+            return dataset[ids[0]:ids[-1] + 1]
+        return np.stack([dataset[idx] for idx in ids])
+    return read
+
+
+def open_reader(path: str) -> Callable[[Sequence[int]], np.ndarray]:
+    dataset = HDF5Dataset(path)
+    return lambda ids: dataset.get_batch(ids)[0]
+
+
+def main(count: int = typer.Option(20000, min=1),
+         size: int = typer.Option(64, min=8),
+         batch: int = typer.Option(64, min=1),
+         batches: int = typer.Option(100, min=1)) -> None:
+    data = make_images(count, size)
+    names = tuple(f"{idx:07d}.png" for idx in range(count))
+    labels = np.arange(count).reshape(-1, 1)
+    rng = np.random.RandomState(0)
+    sequential = [list(range(start, start + batch))
+                  for start in rng.randint(0, max(1, count - batch), batches)]
+    random = [list(rng.choice(count, min(batch, count), replace=False)) for _ in range(batches)]
+    megabytes = batch * data[0].nbytes / 1024 ** 2
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        uncompressed = partial(write_batched, compression=Compression(Codec.none))
+        for name, writer, opener in ((Layout.per_image.value, write_per_image, open_per_image),
+                                     (Layout.batched.value, write_batched, open_batched),
+                                     ("reader", write_batched, open_reader),
+                                     ("memmap", uncompressed, open_reader)):
+            path = os.path.join(tmpdir, f"{name}.h5")
+            start = time.perf_counter()
+            with h5py.File(path, 'w') as hf:
+                writer(hf, names, data, labels)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            read = opener(path)
+            open_time = time.perf_counter() - start
+
+            typer.echo(f"{name:>9}: write {count / write_time:8.0f} images/s, "
+                       f"open+list {open_time * 1000:8.1f} ms, "
+                       f"size {os.path.getsize(path) / 1024 ** 2:.1f} MB")
+            for kind, ids in (("sequential", sequential), ("random", random)):
+                start = time.perf_counter()
+                for batch_ids in ids:
+                    read(batch_ids)
+                elapsed = time.perf_counter() - start
+                typer.echo(f"{'':>11}{kind:>10} batches: {len(ids) / elapsed:8.1f} batches/s "
+                           f"[{len(ids) * megabytes / elapsed:.1f} MB/s]")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,71 @@
+"""
+Compare full resolution decode with reduced JPEG decode used by resize augmentations.
+
+    $ python -m benchmarks.bench_reduced_decode --imdir path/to/jpegs
+
+Without --imdir synthetic 4000x3000 JPEGs are generated in a temporary folder.
+"""
+import os
+import time
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+import cv2
+import typer
+import numpy as np
+
+from distortme.files_utils import images
+from distortme.decode_utils import read_image, JPEG_EXTENSIONS
+
+
+TARGETS = ((512, 512), (300, 300), (256, 256), (224, 224))
+
+
+def make_jpegs(folder: str, count: int, size: Tuple[int, int] = (3000, 4000)) -> None:
+    rng = np.random.RandomState(0)
+    height, width = size
+    grid_y, grid_x = np.mgrid[0:height, 0:width].astype(np.float32)
+    for idx in range(count):
+        image = np.stack([np.sin(grid_x / rng.uniform(20, 200)) * 127 + 128,
+                          np.cos(grid_y / rng.uniform(20, 200)) * 127 + 128,
+                          (grid_x + grid_y) / (width + height) * 255], axis=-1)
+        image += rng.normal(0, 2, image.shape)
+        cv2.imwrite(os.path.join(folder, f"{idx}.jpg"), np.clip(image, 0, 255).astype(np.uint8))
+
+
+def full_decode(path: str, target: Tuple[int, int]) -> np.ndarray:
+    return cv2.resize(cv2.imread(path), target[::-1], interpolation=cv2.INTER_LINEAR)
+
+
+def reduced_decode(path: str, target: Tuple[int, int]) -> np.ndarray:
+    return cv2.resize(read_image(path, target), target[::-1], interpolation=cv2.INTER_LINEAR)
+
+
+def main(imdir: Path = typer.Option(None), count: int = typer.Option(10)) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if imdir is None:
+            make_jpegs(tmpdir, count)
+            imdir = tmpdir
+        paths = tuple(os.path.join(str(imdir), name)
+                      for name in images(str(imdir), JPEG_EXTENSIONS))[:count]
+        typer.echo(f"{'target':>10} {'full ms':>9} {'reduced ms':>11} {'speedup':>8} "
+                   f"{'mean diff':>10} {'max diff':>9} {'PSNR dB':>8}")
+        for target in TARGETS:
+            start = time.perf_counter()
+            full = [full_decode(path, target) for path in paths]
+            full_time = (time.perf_counter() - start) / len(paths)
+            start = time.perf_counter()
+            reduced = [reduced_decode(path, target) for path in paths]
+            reduced_time = (time.perf_counter() - start) / len(paths)
+
+            diff = np.abs(np.stack(full).astype(np.float32) - np.stack(reduced))
+            mse = float(np.mean(diff ** 2))
+            psnr = 10 * np.log10(255 ** 2 / mse) if mse > 0 else float("inf")
+            typer.echo(f"{'x'.join(map(str, target)):>10} {full_time * 1000:9.1f} "
+                       f"{reduced_time * 1000:11.1f} {full_time / reduced_time:7.1f}x "
+                       f"{diff.mean():10.2f} {diff.max():9.0f} {psnr:8.1f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
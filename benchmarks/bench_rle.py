@@ -0,0 +1,100 @@
+"""
+Decode speed of rle masks in layouts of typical Kaggle mask csvs.
+
+    $ python -m benchmarks.bench_rle --count 200
+
+Compares loop over runs (previous rle2mask), vectorized rle2mask for one mask
+and rle2masks for all masks of the same shape at once. Masks are random ellipses,
+'noisy' masks have thousands of runs like masks of defects or clouds.
+Then IoU of detected and ground truth COCO rles is computed on runs and on decoded pixels.
+"""
+import time
+from typing import Callable, Tuple
+
+import cv2
+import typer
+import numpy as np
+
+from distortme.rle_utils import coco2mask, coco_iou, mask2coco, mask2rle, rle2coco, rle2mask, rle2masks
+
+
+# name: (height, width, number of ellipses, noise probability)
+DATASETS = {
+    "ships 768x768": (768, 768, 2, 0.0),
+    "salt 101x101": (101, 101, 1, 0.0),
+    "steel 256x1600": (256, 1600, 4, 0.0),
+    "steel noisy 256x1600": (256, 1600, 4, 0.05),
+    "clouds 1400x2100": (1400, 2100, 3, 0.0),
+}
+
+
+def loop_rle2mask(mask_and_shape: Tuple[str, Tuple[int, int]]) -> np.ndarray:
+    mask_rle, (height, width) = mask_and_shape
+    s = mask_rle.split()
+    starts, lengths = [np.asarray(x, dtype=int) for x in (s[0:][::2], s[1:][::2])]
+    starts -= 1
+    ends = starts + lengths
+    img = np.zeros(height * width, dtype=np.uint8)
+    for lo, hi in zip(starts, ends):
+        img[lo:hi] = 1
+    return img.reshape(width, height).T
+
+
+def make_rles(count: int, height: int, width: int, blobs: int, noise: float) -> Tuple[str, ...]:
+    rng = np.random.RandomState(0)
+    rles = []
+    for _ in range(count):
+        mask = np.zeros((height, width), dtype=np.uint8)
+        for _ in range(blobs):
+            center = (int(rng.randint(width)), int(rng.randint(height)))
+            axes = (int(rng.randint(1, width // 4 + 2)), int(rng.randint(1, height // 4 + 2)))
+            cv2.ellipse(mask, center, axes, float(rng.randint(180)), 0, 360, 1, -1)
+        if noise:
+            mask ^= (rng.rand(height, width) < noise).astype(np.uint8)
+        rles.append(mask2rle(mask))
+    return tuple(rles)
+
+
+def pixel_iou(dts: Tuple[dict, ...], gts: Tuple[dict, ...]) -> np.ndarray:
+    dt_masks = np.stack([coco2mask(rle) for rle in dts]).reshape(len(dts), -1).astype(np.float32)
+    gt_masks = np.stack([coco2mask(rle) for rle in gts]).reshape(len(gts), -1).astype(np.float32)
+    intersection = dt_masks @ gt_masks.T
+    union = dt_masks.sum(axis=1)[:, None] + gt_masks.sum(axis=1)[None] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+
+
+def throughput(function: Callable[[], None], count: int) -> float:
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def main(count: int = typer.Option(200, min=1),
+         gts_count: int = typer.Option(20, min=1)) -> None:
+    typer.echo(f"{'dataset':<22}{'runs/mask':>10}{'loop':>10}{'rle2mask':>10}{'rle2masks':>11}  masks/s")
+    for name, (height, width, blobs, noise) in DATASETS.items():
+        rles = make_rles(count, height, width, blobs, noise)
+        shape = (height, width)
+        expected = np.stack([loop_rle2mask((rle, shape)) for rle in rles])
+        if not np.array_equal(rle2masks(rles, shape), expected):
+            raise RuntimeError(f"rle2masks differs from reference on {name}")
+        runs = np.mean([rle.count(' ') + 1 for rle in rles]) / 2
+        loop = throughput(lambda: [loop_rle2mask((rle, shape)) for rle in rles], count)
+        single = throughput(lambda: [rle2mask((rle, shape)) for rle in rles], count)
+        batch = throughput(lambda: rle2masks(rles, shape), count)
+        typer.echo(f"{name:<22}{runs:>10.0f}{loop:>10.0f}{single:>10.0f}{batch:>11.0f}")
+
+    height, width = DATASETS["ships 768x768"][:2]
+    dts = tuple(rle2coco(rle, (height, width)) for rle in make_rles(count, height, width, 2, 0.0))
+    gts = tuple(mask2coco(rle2mask((rle, (height, width)))) for rle in make_rles(gts_count, height, width, 2, 0.0))
+    if not np.allclose(coco_iou(dts, gts), pixel_iou(dts, gts), atol=1e-6):
+        raise RuntimeError("coco_iou differs from IoU of decoded masks")
+    pairs = len(dts) * len(gts)
+    runs = throughput(lambda: coco_iou(dts, gts), pairs)
+    pixels = throughput(lambda: pixel_iou(dts, gts), pairs)
+    typer.echo(f"IoU of {len(dts)}x{len(gts)} ships masks: {runs:.0f} pairs/s on runs, "
+               f"{pixels:.0f} pairs/s on decoded pixels")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,75 @@
+"""
+Load time of rle labels saved as csv with rle strings and as npz with int32 runs.
+
+    $ python -m benchmarks.bench_rle_format --count 20000
+
+Same masks are saved in both formats of 'distortme torle --format'. Load is reading
+of the file up to runs of every mask, as main_frommrle does before decoding:
+pandas and parsing of every string for csv, one np.load for npz.
+Masks are random ellipses, 'noisy' masks have about thousand runs.
+"""
+import os
+import time
+import tempfile
+from typing import Callable, Tuple
+
+import typer
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_rle import make_rles
+from distortme.rle_utils import load_runs, rle_runs, save_runs, split_runs
+
+
+# name: (height, width, number of ellipses, noise probability)
+DATASETS = {
+    "ships 768x768": (768, 768, 2, 0.0),
+    "steel 256x1600": (256, 1600, 4, 0.0),
+    "steel noisy 256x1600": (256, 1600, 4, 0.002),
+}
+
+
+def load_csv(filename: str) -> Tuple[Tuple[np.ndarray, np.ndarray], ...]:
+    data = pd.read_csv(filename)
+    return tuple(rle_runs(rle) for rle in data["rle"].tolist())
+
+
+def load_npz(filename: str) -> Tuple[Tuple[np.ndarray, np.ndarray], ...]:
+    _, _, runs_and_shapes = load_runs(filename)
+    return tuple(split_runs(runs) for runs, _ in runs_and_shapes)
+
+
+def best_time(function: Callable[[], None], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(count: int = typer.Option(20000, min=1),
+         repeat: int = typer.Option(3, min=1)) -> None:
+    typer.echo(f"{'dataset':<22}{'csv MB':>8}{'npz MB':>8}{'csv s':>8}{'npz s':>8}  speedup")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_file, npz_file = os.path.join(tmpdir, "rles.csv"), os.path.join(tmpdir, "rles.npz")
+        for name, (height, width, blobs, noise) in DATASETS.items():
+            rles = make_rles(count, height, width, blobs, noise)
+            names = tuple(f"{idx:07d}.png" for idx in range(count))
+            pd.DataFrame({"image_name": names, "rle": rles, "size": [(height, width)] * count}).to_csv(
+                csv_file, index=False)
+            runs = tuple(np.fromstring(rle, dtype=np.int32, sep=' ') for rle in rles)
+            save_runs(npz_file, names, ((height, width), ) * count, runs)
+
+            for (csv_starts, csv_ends), (npz_starts, npz_ends) in zip(load_csv(csv_file), load_npz(npz_file)):
+                if not (np.array_equal(csv_starts, npz_starts) and np.array_equal(csv_ends, npz_ends)):
+                    raise RuntimeError(f"runs of npz differ from csv on {name}")
+            csv_time = best_time(lambda: load_csv(csv_file), repeat)
+            npz_time = best_time(lambda: load_npz(npz_file), repeat)
+            sizes = [os.path.getsize(filename) / 2 ** 20 for filename in (csv_file, npz_file)]
+            typer.echo(f"{name:<22}{sizes[0]:>8.1f}{sizes[1]:>8.1f}{csv_time:>8.2f}{npz_time:>8.2f}"
+                       f"  {csv_time / npz_time:.1f}x")
+
+
+if __name__ == "__main__":
+    typer.run(main)
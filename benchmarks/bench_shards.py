@@ -0,0 +1,70 @@
+"""
+Compare read throughput of tar shards with one-file-per-image layout.
+
+    $ python -m benchmarks.bench_shards --imdir path/to/images
+
+Without --imdir small synthetic JPEGs are generated in a temporary folder.
+Page cache is not dropped, run on cold cache (e.g. NFS mount) for realistic numbers.
+"""
+import os
+import time
+import tempfile
+from pathlib import Path
+
+import cv2
+import typer
+import numpy as np
+
+from distortme.files_utils import images
+from distortme.shards_utils import ShardWriter, ShardReader, folder_files
+
+
+def make_jpegs(folder: str, count: int, size: int = 128) -> None:
+    rng = np.random.RandomState(0)
+    for idx in range(count):
+        image = cv2.GaussianBlur(rng.randint(0, 256, (size, size, 3), dtype=np.uint8), (5, 5), 0)
+        cv2.imwrite(os.path.join(folder, f"{idx:07d}.jpg"), image)
+
+
+def read_files(imdir: str) -> int:
+    count = 0
+    for name in images(imdir):
+        with open(os.path.join(imdir, name), 'rb') as file:
+            image = cv2.imdecode(np.frombuffer(file.read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+        count += image is not None
+    return count
+
+
+def read_shards(path: str) -> int:
+    return sum(image is not None for _, image in ShardReader(path))
+
+
+def main(imdir: Path = typer.Option(None),
+         count: int = typer.Option(20000),
+         shard_mb: int = typer.Option(64)) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if imdir is None:
+            imdir = os.path.join(tmpdir, "images")
+            os.mkdir(imdir)
+            make_jpegs(imdir, count)
+        imdir = str(imdir)
+        shards_dir = os.path.join(tmpdir, "shards")
+        os.mkdir(shards_dir)
+
+        start = time.perf_counter()
+        writer = ShardWriter(shards_dir, shard_mb * 1024 * 1024)
+        for name in folder_files(imdir):
+            writer.add(os.path.join(imdir, name), name)
+        writer.close()
+        typer.echo(f"Packed {len(writer.entries)} files into {len(writer.shards)} shards "
+                   f"in {time.perf_counter() - start:.2f}s")
+
+        for layout, reader, path in (("files", read_files, imdir), ("shards", read_shards, shards_dir)):
+            start = time.perf_counter()
+            num = reader(path)
+            elapsed = time.perf_counter() - start
+            typer.echo(f"{layout:>7}: {num} images in {elapsed:.2f}s [{num / elapsed:.0f} images/s]")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,83 @@
+"""
+Measure startup time of every distortme command and check that
+heavy dependencies are not imported before command needs them.
+
+    $ python -m benchmarks.bench_startup --repeat 5 --max-ms 500
+
+Each command is started with --help in a new interpreter, so the time
+includes interpreter start, imports and argument parsing.
+Exits with code 1 if any command is slower than --max-ms or imports heavy modules.
+"""
+import sys
+import json
+import time
+import statistics
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import typer
+
+
+COMMANDS = ("augs", "split", "tohd5", "fromhd5", "toshards", "download", "torle", "fromrle",
+            "unpack", "convert", "label", "info", "voc2coco", "coco2voc", "map", "show")
+HEAVY_MODULES = ("torch", "albumentations", "h5py", "pandas", "aiohttp",
+                 "termplotlib", "cv2", "numpy", "PIL")
+
+SCRIPT = """
+import sys
+from distortme.main import app
+try:
+    app(sys.argv[1:], prog_name="distortme")
+except SystemExit:
+    pass
+heavy = [name for name in {heavy!r} if name in sys.modules]
+sys.stderr.write("HEAVY:" + ",".join(heavy))
+"""
+
+
+def run_command(command: str) -> Tuple[float, List[str]]:
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", SCRIPT.format(heavy=HEAVY_MODULES), command, "--help"],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    output = process.stderr.decode()
+    heavy = output.rsplit("HEAVY:", 1)[-1].strip() if "HEAVY:" in output else "<crashed>"
+    return elapsed, [name for name in heavy.split(",") if name]
+
+
+def interpreter_time() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"])
+    return time.perf_counter() - start
+
+
+def main(repeat: int = typer.Option(5, min=1),
+         max_ms: float = typer.Option(None, min=1),
+         out: Optional[Path] = typer.Option(None)) -> None:
+    baseline = statistics.median(interpreter_time() for _ in range(repeat))
+    typer.echo(f"{'interpreter':<12}{baseline * 1000:>9.1f} ms")
+
+    results, failed = {}, []
+    for command in COMMANDS:
+        times, heavy = [], []
+        for _ in range(repeat):
+            elapsed, heavy = run_command(command)
+            times.append(elapsed)
+        median = statistics.median(times)
+        results[command] = {"median_ms": median * 1000, "heavy_modules": heavy}
+        slow = max_ms is not None and median * 1000 > max_ms
+        if heavy or slow:
+            failed.append(command)
+        typer.echo(f"{command:<12}{median * 1000:>9.1f} ms  {', '.join(heavy)}")
+
+    if out is not None:
+        with open(out, 'w') as file:
+            json.dump({"interpreter_ms": baseline * 1000, "commands": results}, file, indent=2)
+    if failed:
+        typer.echo(f"Slow or importing heavy modules: {', '.join(failed)}")
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
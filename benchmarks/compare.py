@@ -0,0 +1,50 @@
+"""
+Compare two results of benchmarks.run, e.g. of two commits.
+
+    $ python -m benchmarks.compare base.json new.json --threshold 0.1
+
+Exits with code 1 if any benchmark became slower than threshold allows.
+"""
+import json
+from pathlib import Path
+from typing import Dict
+
+import typer
+
+
+def load(path: Path) -> Dict:
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def main(base: Path = typer.Argument(..., exists=True, dir_okay=False),
+         new: Path = typer.Argument(..., exists=True, dir_okay=False),
+         threshold: float = typer.Option(0.1, min=0.0)) -> None:
+    base_report, new_report = load(base), load(new)
+    typer.echo(f"base: {base_report.get('commit')}  new: {new_report.get('commit')}")
+    for key in ("scale", "size", "workers", "cpus"):
+        if base_report.get(key) != new_report.get(key):
+            typer.echo(f"Warning: {key} differs ({base_report.get(key)} vs {new_report.get(key)})")
+
+    typer.echo(f"{'benchmark':<14}{'base s':>10}{'new s':>10}{'speedup':>10}")
+    regressions = []
+    for name, new_result in new_report["results"].items():
+        base_result = base_report["results"].get(name)
+        if base_result is None or "error" in base_result or "error" in new_result:
+            typer.echo(f"{name:<14}{'-':>10}{'-':>10}{'n/a':>10}")
+            continue
+        speedup = base_result["best_s"] / new_result["best_s"]
+        mark = ""
+        if speedup < 1 / (1 + threshold):
+            regressions.append(name)
+            mark = "  REGRESSION"
+        typer.echo(f"{name:<14}{base_result['best_s']:>10.3f}{new_result['best_s']:>10.3f}"
+                   f"{speedup:>9.2f}x{mark}")
+
+    if regressions:
+        typer.echo(f"Slower by more than {threshold:.0%}: {', '.join(regressions)}")
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
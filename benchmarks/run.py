@@ -0,0 +1,204 @@
+"""
+Time every main_* entry point of distortme on synthetic data.
+
+    $ python -m benchmarks.run --scale 1000 --out results.json
+    $ python -m benchmarks.compare base.json results.json
+
+Each benchmark runs in a fresh copy of generated data, so commands which
+modify their input (convert, split) don't affect each other.
+Works offline and without GPU.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import contextlib
+import statistics
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import typer
+
+from benchmarks.synthetic import generate
+from distortme.pool_utils import configure_pool, shutdown_pool, POOL_CONFIG
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CUSTOM_MAP = os.path.join(REPO_ROOT, "assets", "example_custom_map.py")
+
+
+def bench_augs() -> None:
+    from distortme.aug_utils import main_apply_augmentations, SlowAugs
+    main_apply_augmentations("images", [SlowAugs.rotate, SlowAugs.resize224], force=True)
+
+
+def bench_augs_onepass() -> None:
+    from distortme.aug_utils import main_apply_augmentations, SlowAugs
+    main_apply_augmentations("images", [SlowAugs.rotate, SlowAugs.resize224], onepass=True, force=True)
+
+
+def bench_convert() -> None:
+    from distortme.convert_utils import main_convert
+    main_convert("images", [], "png")
+
+
+def bench_split() -> None:
+    from distortme.split_utils import main_split_files
+    main_split_files("images", ["cls_0", "cls_1"], True)
+
+
+def bench_map() -> None:
+    from distortme.cusom_map_utils import main_custom_map
+    main_custom_map("images", CUSTOM_MAP, "mapped")
+
+
+def bench_torle() -> None:
+    from distortme.rle_utils import main_torle
+    main_torle("masks")
+
+
+def bench_fromrle() -> None:
+    from distortme.rle_utils import main_frommrle
+    main_frommrle("rle_of_masks.csv", "rle", "size", "image_name")
+
+
+def bench_tohd5() -> None:
+    from distortme.hdf5_utils import main_save_to_hdf5
+    main_save_to_hdf5("images", None)
+
+
+def bench_fromhd5() -> None:
+    from distortme.hdf5_utils import main_extract_from_hdf5
+    main_extract_from_hdf5(("images.h5", ))
+
+
+def bench_voc2coco() -> None:
+    from distortme.voc2coco_utils import main_voc2coco
+    main_voc2coco("voc/Annotations", "voc/ids.txt", "voc/labels.txt", "voc_coco.json")
+
+
+def bench_coco2voc() -> None:
+    from distortme.coco2voc_utils import main_coco2voc
+    main_coco2voc("coco/instances_bench.json", "coco_voc")
+
+
+def bench_toshards() -> None:
+    from distortme.shards_utils import main_to_shards
+    main_to_shards("images", "shards", 64, False)
+
+
+# name -> (benchmark, setup run before timing or None)
+BENCHMARKS: Dict[str, Tuple[Callable[[], None], Optional[Callable[[], None]]]] = {
+    "augs": (bench_augs, None),
+    "augs_onepass": (bench_augs_onepass, None),
+    "convert": (bench_convert, None),
+    "split": (bench_split, None),
+    "map": (bench_map, None),
+    "torle": (bench_torle, None),
+    "fromrle": (bench_fromrle, bench_torle),
+    "tohd5": (bench_tohd5, None),
+    "fromhd5": (bench_fromhd5, bench_tohd5),
+    "voc2coco": (bench_voc2coco, None),
+    "coco2voc": (bench_coco2voc, None),
+    "toshards": (bench_toshards, None),
+}
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        yield
+
+
+def git_commit() -> Tuple[Optional[str], Optional[bool]]:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+        status = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                         cwd=REPO_ROOT, stderr=subprocess.DEVNULL).decode()
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def run_one(name: str, data_dir: str, workdir: str, repeat: int, verbose: bool) -> Dict:
+    benchmark, setup = BENCHMARKS[name]
+    times: List[float] = []
+    cwd = os.getcwd()
+    for _ in range(repeat):
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.copytree(data_dir, workdir)
+        os.chdir(workdir)
+        try:
+            with quiet(not verbose):
+                if setup is not None:
+                    setup()
+                start = time.perf_counter()
+                benchmark()
+                times.append(time.perf_counter() - start)
+        except Exception as error:
+            return {"error": f"{type(error).__name__}: {error}"}
+        finally:
+            shutdown_pool()
+            os.chdir(cwd)
+    return {"times_s": times,
+            "best_s": min(times),
+            "median_s": statistics.median(times)}
+
+
+def main(scale: int = typer.Option(1000, min=1),
+         size: int = typer.Option(128, min=16),
+         repeat: int = typer.Option(3, min=1),
+         workers: int = typer.Option(os.cpu_count() or 1, min=1),
+         only: List[str] = typer.Option(None),
+         out: Path = typer.Option("benchmark_results.json"),
+         verbose: bool = typer.Option(False)) -> None:
+    names = list(only) if only else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        typer.echo(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        raise typer.Exit(1)
+
+    configure_pool(workers)
+    commit, dirty = git_commit()
+    report = {"commit": commit,
+              "dirty": dirty,
+              "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": sys.version.split()[0],
+              "platform": platform.platform(),
+              "cpus": os.cpu_count(),
+              "workers": POOL_CONFIG.workers,
+              "scale": scale,
+              "size": size,
+              "repeat": repeat,
+              "results": {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data_dir = os.path.join(tmpdir, "data")
+        start = time.perf_counter()
+        generate(data_dir, scale, size)
+        typer.echo(f"Generated {scale} items in {time.perf_counter() - start:.1f}s")
+        for name in names:
+            result = run_one(name, data_dir, os.path.join(tmpdir, "work"), repeat, verbose)
+            if "error" not in result:
+                result["items_per_s"] = scale / result["best_s"]
+                typer.echo(f"{name:<14}{result['best_s']:>9.3f}s {result['items_per_s']:>10.1f} items/s")
+            else:
+                typer.echo(f"{name:<14} failed: {result['error']}")
+            report["results"][name] = result
+
+    with open(out, 'w') as file:
+        json.dump(report, file, indent=2)
+    typer.echo(f"Results saved to {out}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,117 @@
+"""
+Generate synthetic dataset for benchmarks.
+
+    $ python -m benchmarks.synthetic --out data --scale 10000
+
+Layout of generated folder:
+
+    images/          <scale> JPEG images named img_<id>_cls_<0|1>.jpg
+    masks/           <scale> PNG binary masks
+    voc/Annotations/ <scale> PASCAL VOC .xml files
+    voc/ids.txt      ids of VOC annotations
+    voc/labels.txt   names of classes
+    coco/instances_bench.json  COCO annotations for <scale> images
+
+Only a few distinct images and masks are encoded, then their bytes are
+written repeatedly, so generating 1M items is bound by disk speed.
+"""
+import os
+import json
+from pathlib import Path
+from typing import Dict
+
+import cv2
+import typer
+import numpy as np
+
+
+LABELS = ("cat", "dog", "person", "car")
+VARIANTS = 16
+
+
+def encoded_images(size: int, rng: np.random.RandomState) -> tuple:
+    grid_y, grid_x = np.mgrid[0:size, 0:size].astype(np.float32)
+    result = []
+    for _ in range(VARIANTS):
+        image = np.stack([np.sin(grid_x / rng.uniform(4, 40)) * 127 + 128,
+                          np.cos(grid_y / rng.uniform(4, 40)) * 127 + 128,
+                          rng.normal(128, 30, (size, size))], axis=-1)
+        result.append(cv2.imencode(".jpg", np.clip(image, 0, 255).astype(np.uint8))[1].tobytes())
+    return tuple(result)
+
+
+def encoded_masks(size: int, rng: np.random.RandomState) -> tuple:
+    result = []
+    for _ in range(VARIANTS):
+        mask = np.zeros((size, size, 3), dtype=np.uint8)
+        for _ in range(rng.randint(1, 6)):
+            center = tuple(int(x) for x in rng.randint(0, size, 2))
+            cv2.circle(mask, center, int(rng.randint(size // 16 + 1, size // 4 + 2)), (255, 255, 255), -1)
+        result.append(cv2.imencode(".png", mask)[1].tobytes())
+    return tuple(result)
+
+
+def write_bytes(path: str, data: bytes) -> None:
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def voc_xml(idx: int, size: int, rng: np.random.RandomState) -> str:
+    objects = []
+    for _ in range(rng.randint(1, 4)):
+        xmin, ymin = rng.randint(1, size // 2, 2)
+        xmax, ymax = xmin + rng.randint(2, size // 2), ymin + rng.randint(2, size // 2)
+        objects.append(f"<object><name>{LABELS[rng.randint(len(LABELS))]}</name>"
+                       f"<bndbox><xmin>{xmin}</xmin><ymin>{ymin}</ymin>"
+                       f"<xmax>{xmax}</xmax><ymax>{ymax}</ymax></bndbox></object>")
+    return (f"<annotation><filename>{idx:012d}.jpg</filename>"
+            f"<size><width>{size}</width><height>{size}</height><depth>3</depth></size>"
+            + "".join(objects) + "</annotation>")
+
+
+def coco_json(scale: int, size: int, rng: np.random.RandomState) -> Dict:
+    images = [{"id": idx, "file_name": f"{idx:012d}.jpg", "coco_url": f"http://localhost/{idx:012d}.jpg",
+               "width": size, "height": size} for idx in range(scale)]
+    annotations = []
+    for idx in range(scale):
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(0, size // 2, 2)
+            w, h = rng.randint(2, size // 2, 2)
+            annotations.append({"id": len(annotations) + 1, "image_id": idx,
+                                "category_id": int(rng.randint(1, len(LABELS) + 1)),
+                                "bbox": [int(x), int(y), int(w), int(h)],
+                                "area": int(w * h), "iscrowd": 0})
+    categories = [{"id": idx + 1, "name": name, "supercategory": "none"}
+                  for idx, name in enumerate(LABELS)]
+    return {"images": images, "annotations": annotations, "categories": categories}
+
+
+def generate(out: str, scale: int, size: int = 128, seed: int = 0) -> None:
+    rng = np.random.RandomState(seed)
+    for folder in ("images", "masks", "voc/Annotations", "coco"):
+        os.makedirs(os.path.join(out, folder), exist_ok=True)
+
+    jpegs, masks = encoded_images(size, rng), encoded_masks(size, rng)
+    for idx in range(scale):
+        write_bytes(os.path.join(out, "images", f"img_{idx:07d}_cls_{idx % 2}.jpg"), jpegs[idx % VARIANTS])
+        write_bytes(os.path.join(out, "masks", f"mask_{idx:07d}.png"), masks[idx % VARIANTS])
+        write_bytes(os.path.join(out, "voc", "Annotations", f"{idx:012d}.xml"),
+                    voc_xml(idx, size, rng).encode())
+
+    with open(os.path.join(out, "voc", "ids.txt"), 'w') as file:
+        file.write("\n".join(f"{idx:012d}" for idx in range(scale)))
+    with open(os.path.join(out, "voc", "labels.txt"), 'w') as file:
+        file.write("\n".join(LABELS))
+    with open(os.path.join(out, "coco", "instances_bench.json"), 'w') as file:
+        json.dump(coco_json(scale, size, rng), file)
+
+
+def main(out: Path = typer.Option("synthetic_data"),
+         scale: int = typer.Option(1000, min=1),
+         size: int = typer.Option(128, min=16),
+         seed: int = typer.Option(0)) -> None:
+    generate(str(out), scale, size, seed)
+
+
+if __name__ == "__main__":
+    typer.run(main)
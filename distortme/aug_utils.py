@@ -1,46 +1,214 @@
 import os
-import cv2
+import time
+import zlib
+import random
+import typer
+import numpy as np
 from tqdm import tqdm
-import multiprocessing as mp
-from typing import Sequence, List
+from collections import defaultdict
+from typing import Callable, Optional, Sequence, List, Tuple
 
 
 from distortme.base_types import Image, BaseAug
-from distortme.augmentations import SLOW_AUGS_DICT, SlowAugs
+from distortme.augmentations import SLOW_AUGS_DICT, SlowAugs, build_chain, decode_target
+from distortme.batch_augmentations import Batch, batch_function
+from distortme.decode_utils import read_image, write_image
 from distortme.files_utils import create_folders, full_path, images
-from distortme.main_utils import print_delimiter
+from distortme.main_utils import print_delimiter, print_throughput
+from distortme.manifest_utils import Manifest
+from distortme.profile_utils import stage
+from distortme.pool_utils import pool_imap
 
 
 class ApplyAugmentation:
-    def __init__(self, output_folder: str, aug: BaseAug) -> None:
+    def __init__(self, output_folder: str, aug: BaseAug,
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
         self.aug = aug
         self.output_folder = output_folder
+        self.target_size = target_size
+
+    def _read_image(self, path: str) -> Image:
+        return read_image(path, self.target_size)
 
     def _apply_aug(self, image: Image, current_aug: BaseAug) -> Image:
-        return current_aug(image=image)["image"]
+        with stage("compute"):
+            return current_aug(image=image)["image"]
 
     def _save_image(self, image: Image, path: str) -> None:
-        cv2.imwrite(path, image)
+        write_image(path, image)
 
-    def __call__(self, img_path: str) -> None:
+    def __call__(self, img_path: str) -> str:
         img_name = img_path.split('/')[-1]
-        self._save_image(self._apply_aug(cv2.imread(img_path), self.aug),
+        self._save_image(self._apply_aug(self._read_image(img_path), self.aug),
                          os.path.join(self.output_folder, img_name))
+        return img_path
+
+
+class ApplyAugmentations(ApplyAugmentation):
+    """
+    Decode image once and apply every augmentation to it.
+    Result of each augmentation is saved to the corresponding folder.
+    Each task is a path to image and indices of augmentations to apply.
+    """
+
+    def __init__(self, output_folders: Sequence[str], augs: Sequence[BaseAug],
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
+        self.augs = tuple(augs)
+        self.output_folders = tuple(output_folders)
+        self.target_size = target_size
+
+    def __call__(self, task: Tuple[str, Tuple[int, ...]]) -> Tuple[str, Tuple[int, ...]]:
+        img_path, aug_indices = task
+        img_name = os.path.basename(img_path)
+        image = self._read_image(img_path)
+        for idx in aug_indices:
+            self._save_image(self._apply_aug(image, self.augs[idx]),
+                             os.path.join(self.output_folders[idx], img_name))
+        return task
+
+
+class ApplyAugmentationsBatch(ApplyAugmentations):
+    """
+    Decode batch of images once and apply every augmentation to it.
+    Augmentations with vectorized implementation are applied to groups of
+    same-sized images at once. Other augmentations and ragged images
+    are processed one by one.
+    """
+
+    def __init__(self, output_folders: Sequence[str], augs: Sequence[BaseAug],
+                 batch_fns: Sequence[Optional[Callable[[Batch, BaseAug], Batch]]],
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
+        super().__init__(output_folders, augs, target_size)
+        self.batch_fns = tuple(batch_fns)
+
+    def __call__(self, tasks: Sequence[Tuple[str, Tuple[int, ...]]]) -> Sequence[Tuple[str, Tuple[int, ...]]]:
+        loaded_images = tuple(self._read_image(img_path) for img_path, _ in tasks)
+        for idx, (aug, batch_fn) in enumerate(zip(self.augs, self.batch_fns)):
+            groups = defaultdict(list)
+            for task_idx, (_, aug_indices) in enumerate(tasks):
+                if idx in aug_indices:
+                    groups[loaded_images[task_idx].shape].append(task_idx)
+            for members in groups.values():
+                if batch_fn is not None and len(members) > 1:
+                    with stage("compute"):
+                        results = batch_fn(np.stack([loaded_images[i] for i in members]), aug)
+                else:
+                    results = tuple(self._apply_aug(loaded_images[i], aug) for i in members)
+                for task_idx, result in zip(members, results):
+                    img_name = os.path.basename(tasks[task_idx][0])
+                    self._save_image(result, os.path.join(self.output_folders[idx], img_name))
+        return tasks
+
 
+class ApplyChain(ApplyAugmentation):
+    """
+    Decode image once and save several randomized results of augmentations chain.
+    Random state is seeded from image name, variant and base seed, so results
+    don't depend on number of workers.
+    """
 
-def augment_all_images(images: Sequence[str], output_folder: str, aug: BaseAug) -> None:
-    process_one_image = ApplyAugmentation(output_folder, aug)
-    pool = mp.Pool(mp.cpu_count())
-    pool.map(process_one_image, images)
+    def __init__(self, output_folder: str, aug: BaseAug, variants: int, seed: int,
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
+        super().__init__(output_folder, aug, target_size)
+        self.variants = variants
+        self.seed = seed
+
+    def _set_seed(self, img_name: str, variant: int) -> None:
+        seed = zlib.crc32(f"{img_name}:{variant}".encode(), self.seed)
+        random.seed(seed)
+        np.random.seed(seed)
+
+    def __call__(self, img_path: str) -> str:
+        img_name = os.path.basename(img_path)
+        name, ext = os.path.splitext(img_name)
+        image = self._read_image(img_path)
+        for variant in range(self.variants):
+            self._set_seed(img_name, variant)
+            self._save_image(self._apply_aug(image, self.aug),
+                             os.path.join(self.output_folder, f"{name}_{variant}{ext}"))
+        return img_path
+
+
+def augment_all_images(images: Sequence[str], output_folder: str, aug: BaseAug,
+                       manifest: Manifest,
+                       target_size: Optional[Tuple[int, int]] = None) -> None:
+    process_one_image = ApplyAugmentation(output_folder, aug, target_size)
+    for img_path in pool_imap(process_one_image, images, ordered=False):
+        manifest.done(img_path)
+    manifest.save()
+
+
+def augment_all_images_once(images: Sequence[str],
+                            output_folders: Sequence[str],
+                            augs: Sequence[BaseAug],
+                            manifests: Sequence[Manifest],
+                            target_size: Optional[Tuple[int, int]] = None,
+                            aug_names: Sequence[str] = (),
+                            batch_size: int = 1) -> int:
+    stale = tuple(frozenset(manifest.stale(images)) for manifest in manifests)
+    tasks = tuple((img_path, tuple(idx for idx, paths in enumerate(stale) if img_path in paths))
+                  for img_path in images)
+    tasks = tuple(task for task in tasks if task[1])
+    if batch_size > 1:
+        batch_fns = tuple(batch_function(name, aug) for name, aug in zip(aug_names, augs))
+        process_batch = ApplyAugmentationsBatch(output_folders, augs, batch_fns, target_size)
+        batches = tuple(tasks[idx:idx + batch_size] for idx in range(0, len(tasks), batch_size))
+        results = (task for batch in pool_imap(process_batch, batches, ordered=False)
+                   for task in batch)
+    else:
+        process_one_image = ApplyAugmentations(output_folders, augs, target_size)
+        results = pool_imap(process_one_image, tasks, ordered=False)
+    for img_path, aug_indices in results:
+        for idx in aug_indices:
+            manifests[idx].done(img_path)
+    for manifest in manifests:
+        manifest.save()
+    return len(tasks)
 
 
 @print_delimiter("Applying augmentations to images")
-def main_apply_augmentations(imdir: str, augs: List[SlowAugs]) -> None:
+def main_apply_augmentations(imdir: str, augs: List[SlowAugs],
+                             onepass: bool = False, force: bool = False,
+                             batch_size: int = 1) -> None:
     all_images = tuple(map(lambda x: os.path.join(imdir, x), images(imdir)))
     used_augs = tuple(SLOW_AUGS_DICT[aug.value] for aug in augs)
     aug_folders = tuple(full_path(tuple(aug.value for aug in augs), imdir))
     create_folders(aug_folders)
-    pbar = tqdm(zip(aug_folders, used_augs, augs), ncols=80)
-    for out_dir, out_aug, aug_name in pbar:
-        augment_all_images(all_images, out_dir, out_aug)
-        pbar.set_description(f"Augmetation: [{aug_name}]")
+    manifests = tuple(Manifest(out_dir, repr(out_aug), force)
+                      for out_dir, out_aug in zip(aug_folders, used_augs))
+    start = time.perf_counter()
+    if onepass or batch_size > 1:
+        processed = augment_all_images_once(all_images, aug_folders, used_augs,
+                                            manifests, decode_target(augs),
+                                            tuple(aug.value for aug in augs), batch_size)
+    else:
+        processed_images = set()
+        pbar = tqdm(zip(aug_folders, used_augs, augs, manifests), ncols=80)
+        for out_dir, out_aug, aug_name, manifest in pbar:
+            stale_images = manifest.stale(all_images)
+            augment_all_images(stale_images, out_dir, out_aug, manifest,
+                               decode_target((aug_name, )))
+            processed_images.update(stale_images)
+            pbar.set_description(f"Augmetation: [{aug_name}]")
+        processed = len(processed_images)
+    print_throughput(processed, time.perf_counter() - start)
+    typer.echo(f"Skipped {len(all_images) - processed} up-to-date images")
+
+
+@print_delimiter("Applying chain of augmentations to images")
+def main_apply_chain(imdir: str, chain: List[SlowAugs], variants: int, seed: int,
+                     force: bool = False) -> None:
+    all_images = tuple(map(lambda x: os.path.join(imdir, x), images(imdir)))
+    out_dir = os.path.join(imdir, "chain_" + "_".join(aug.value for aug in chain))
+    create_folders((out_dir, ))
+    chain_aug = build_chain(chain)
+    manifest = Manifest(out_dir, f"{chain_aug!r} variants={variants} seed={seed}", force)
+    stale_images = manifest.stale(all_images)
+    process_one_image = ApplyChain(out_dir, chain_aug, variants, seed,
+                                   decode_target(chain[:1]))
+    start = time.perf_counter()
+    for img_path in pool_imap(process_one_image, stale_images, ordered=False):
+        manifest.done(img_path)
+    manifest.save()
+    print_throughput(len(stale_images), time.perf_counter() - start)
+    typer.echo(f"Skipped {len(all_images) - len(stale_images)} up-to-date images")
@@ -1,8 +1,12 @@
 from enum import Enum
+from typing import TYPE_CHECKING, Mapping, Optional, Sequence, Tuple
 from frozendict import frozendict
-from albumentations import (Rotate, ShiftScaleRotate, RandomContrast,
-                            HueSaturationValue, Equalize, RandomCrop,
-                            Resize, RandomBrightness, ToGray)
+
+from distortme.lazy_utils import LazyMapping
+
+if TYPE_CHECKING:
+    from albumentations import Compose
+    from distortme.base_types import BaseAug
 
 
 class SlowAugs(str, Enum):
@@ -20,17 +24,48 @@ class SlowAugs(str, Enum):
     bright = "bright"
 
 
-SLOW_AUGS_DICT = frozendict(
-    rotate=Rotate(always_apply=True),
-    shift_scale_rotate=ShiftScaleRotate(always_apply=True),
-    shift_hsv=HueSaturationValue(always_apply=True),
-    equalize=Equalize(always_apply=True),
-    to_gray=ToGray(always_apply=True),
-    resize512=Resize(512, 512, always_apply=True),
-    resize300=Resize(300, 300, always_apply=True),
-    resize256=Resize(256, 256, always_apply=True),
-    resiz224=Resize(224, 224, always_apply=True),
-    contrast=RandomContrast(always_apply=True),
-    crop=RandomCrop(64, 64, always_apply=True),
-    bright=RandomBrightness(always_apply=True)
+def create_slow_augs() -> Mapping[str, "BaseAug"]:
+    from albumentations import (Rotate, ShiftScaleRotate, RandomContrast,
+                                HueSaturationValue, Equalize, RandomCrop,
+                                Resize, RandomBrightness, ToGray)
+    return frozendict(
+        rotate=Rotate(always_apply=True),
+        shift_scale_rotate=ShiftScaleRotate(always_apply=True),
+        shift_hsv=HueSaturationValue(always_apply=True),
+        equalize=Equalize(always_apply=True),
+        to_gray=ToGray(always_apply=True),
+        resize512=Resize(512, 512, always_apply=True),
+        resize300=Resize(300, 300, always_apply=True),
+        resize256=Resize(256, 256, always_apply=True),
+        resize224=Resize(224, 224, always_apply=True),
+        contrast=RandomContrast(always_apply=True),
+        crop=RandomCrop(64, 64, always_apply=True),
+        bright=RandomBrightness(always_apply=True)
+    )
+
+
+# Transforms are created on first access, albumentations is not imported before
+SLOW_AUGS_DICT = LazyMapping(create_slow_augs)
+
+RESIZE_TARGETS = frozendict(
+    resize512=(512, 512),
+    resize300=(300, 300),
+    resize256=(256, 256),
+    resize224=(224, 224)
 )
+
+
+def build_chain(augs: Sequence[SlowAugs]) -> "Compose":
+    from albumentations import Compose
+    return Compose([SLOW_AUGS_DICT[aug.value] for aug in augs])
+
+
+def decode_target(augs: Sequence[SlowAugs]) -> Optional[Tuple[int, int]]:
+    """
+    Smallest size image may be decoded at if only resize augmentations are applied to it
+    """
+
+    targets = tuple(RESIZE_TARGETS.get(aug.value) for aug in augs)
+    if not targets or None in targets:
+        return None
+    return max(target[0] for target in targets), max(target[1] for target in targets)
@@ -3,13 +3,15 @@ import numpy as np
 from nptyping import NDArray
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Union, Tuple, Dict, Any, List
-from albumentations import BasicIAATransform, BasicTransform
+from typing import TYPE_CHECKING, Union, Tuple, Dict, Any, List
+
+if TYPE_CHECKING:
+    from albumentations import BasicIAATransform, BasicTransform
 
 
 Image = Union[NDArray[np.uint8], NDArray[np.float]]
 ImageShape = Union[Tuple[int, int], Tuple[int, int, int]]
-BaseAug = Union[BasicTransform, BasicIAATransform]
+BaseAug = Union["BasicTransform", "BasicIAATransform"]
 Labels = NDArray[int]
 Box = Tuple[float, float, float, float]
 Boxes = Tuple[Box, ...]
@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+from frozendict import frozendict
+from typing import Callable, Optional
+
+from distortme.base_types import BaseAug
+
+
+# Batch of same-sized uint8 images with shape (N, H, W, C)
+Batch = np.ndarray
+
+
+def apply_luts(batch: Batch, luts: np.ndarray) -> Batch:
+    """
+    Apply individual lookup table to each sample of batch.
+    Tables are built for whole batch at once, but applied with cv2.LUT
+    per sample, because gather over batch in NumPy is several times slower.
+
+    Parameters
+    ----------
+        batch: Batch
+            Images with shape (N, H, W, C)
+
+        luts: np.ndarray
+            Lookup tables with shape (N, 256) shared by all channels of sample
+            or (N, C, 256) with table for each channel
+    """
+
+    if luts.ndim == 3:
+        luts = np.ascontiguousarray(luts.transpose(0, 2, 1))[:, None]
+    result = np.empty_like(batch)
+    for image, lut, out in zip(batch, luts, result):
+        cv2.LUT(image, lut, dst=out)
+    return result
+
+
+def batch_brightness_contrast(batch: Batch, aug: BaseAug) -> Batch:
+    """
+    Vectorized RandomBrightnessContrast, RandomBrightness and RandomContrast for uint8 images
+    """
+
+    num = batch.shape[0]
+    alpha = 1.0 + np.random.uniform(*aug.contrast_limit, size=(num, 1))
+    beta = np.random.uniform(*aug.brightness_limit, size=(num, 1))
+    luts = np.tile(np.arange(256, dtype=np.float32), (num, 1)) * alpha.astype(np.float32)
+    if aug.brightness_by_max:
+        luts += (beta * 255).astype(np.float32)
+    else:
+        luts += (beta * batch.reshape(num, -1).mean(axis=1, keepdims=True)).astype(np.float32)
+    return apply_luts(batch, np.clip(luts, 0, 255).astype(np.uint8))
+
+
+def batch_shift_hsv(batch: Batch, aug: BaseAug) -> Batch:
+    """
+    Vectorized HueSaturationValue for uint8 images.
+    Color conversion is done for whole batch at once as for one tall image
+    """
+
+    num, height, width, channels = batch.shape
+    shifts = np.stack([np.random.uniform(*aug.hue_shift_limit, size=num),
+                       np.random.uniform(*aug.sat_shift_limit, size=num),
+                       np.random.uniform(*aug.val_shift_limit, size=num)], axis=1)
+    base = np.arange(256, dtype=np.int16)
+    luts = base + shifts[:, :, None]
+    luts[:, 0] = np.mod(luts[:, 0], 180)
+    luts[:, 1:] = np.clip(luts[:, 1:], 0, 255)
+    luts = luts.astype(np.uint8)
+    luts[shifts == 0] = base.astype(np.uint8)
+
+    hsv = cv2.cvtColor(batch.reshape(num * height, width, channels), cv2.COLOR_RGB2HSV)
+    hsv = apply_luts(hsv.reshape(batch.shape), luts)
+    return cv2.cvtColor(hsv.reshape(num * height, width, channels),
+                        cv2.COLOR_HSV2RGB).reshape(batch.shape)
+
+
+def batch_to_gray(batch: Batch, aug: BaseAug) -> Batch:
+    num, height, width, channels = batch.shape
+    gray = cv2.cvtColor(batch.reshape(num * height, width, channels), cv2.COLOR_RGB2GRAY)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB).reshape(batch.shape)
+
+
+def batch_equalize(batch: Batch, aug: BaseAug) -> Batch:
+    """
+    Per-channel histogram equalization of batch.
+    Histograms are image specific and cv2.equalizeHist is faster than building
+    them over batch in NumPy, so it is called directly for each channel.
+    """
+
+    result = np.empty_like(batch)
+    for image, out in zip(batch, result):
+        for channel in range(batch.shape[-1]):
+            out[..., channel] = cv2.equalizeHist(np.ascontiguousarray(image[..., channel]))
+    return result
+
+
+BATCH_AUGS = frozendict(
+    contrast=batch_brightness_contrast,
+    bright=batch_brightness_contrast,
+    to_gray=batch_to_gray,
+    shift_hsv=batch_shift_hsv,
+    equalize=batch_equalize
+)
+
+
+def batch_function(aug_name: str, aug: BaseAug) -> Optional[Callable[[Batch, BaseAug], Batch]]:
+    """
+    Vectorized implementation of augmentation or None if it should be applied per image
+    """
+
+    if aug_name == "equalize" and (aug.mode != "cv" or not aug.by_channels):
+        return None
+    return BATCH_AUGS.get(aug_name)
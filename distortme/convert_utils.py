@@ -1,19 +1,20 @@
 import os
 import cv2
-import multiprocessing as mp
-from typing import List, Sequence
-from tqdm.contrib.concurrent import process_map
+from typing import List, Optional, Sequence, Tuple
 
 from distortme.files_utils import images
+from distortme.decode_utils import ImageReader
 from distortme.main_utils import print_delimiter
+from distortme.pool_utils import pool_map
 
 
-def convert(imdir: str, orig_ext: Sequence[str], target_ext: str) -> None:
+def convert(imdir: str, orig_ext: Sequence[str], target_ext: str,
+            target_size: Optional[Tuple[int, int]] = None) -> None:
 
     if not target_ext.startswith('.'):
         target_ext = "." + target_ext
 
-    if len(orig_ext) == 0:
+    if not orig_ext:
         original_images = images(imdir)
     else:
         original_images = images(imdir, tuple(orig_ext))
@@ -27,11 +28,11 @@ def convert(imdir: str, orig_ext: Sequence[str], target_ext: str) -> None:
     new_locations = tuple(os.path.join(imdir, img)
                           for img in new_images)
 
+    reader = ImageReader(target_size)
     if len(image_locations) < 2:
-        image_data = tuple(cv2.imread(img) for img in image_locations)
+        image_data = tuple(reader(img) for img in image_locations)
     else:
-        image_data = process_map(cv2.imread, image_locations,
-                                 max_workers=mp.cpu_count(), ncols=80)
+        image_data = pool_map(reader, image_locations)
 
     for orig_loc in orig_locations:
         os.remove(orig_loc)  # TODO : process with MP
@@ -42,5 +43,6 @@ def convert(imdir: str, orig_ext: Sequence[str], target_ext: str) -> None:
 
 
 @print_delimiter("Converting files...")
-def main_convert(imdir: str, orig: List[str], to: str) -> None:
-    convert(imdir, orig, to)
+def main_convert(imdir: str, orig: List[str], to: str,
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
+    convert(imdir, orig, to, target_size)
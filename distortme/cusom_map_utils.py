@@ -1,25 +1,21 @@
 import os
 import cv2
 import typer
-from tqdm import tqdm
+import numpy as np
 import importlib.util
-from tqdm.contrib.concurrent import process_map
-from typing import Callable, Optional, Any, Sequence, Tuple
+from collections import defaultdict
+from typing import Dict, Optional, Any, Sequence, Tuple
 
 from distortme.base_types import Image
 from distortme.main_utils import print_delimiter
+from distortme.pool_utils import pool_imap
+from distortme.profile_utils import stage
 from distortme.files_utils import images, create_folders
+from distortme.decode_utils import ImageReader
 
 
-def apply_custom_map(images: Sequence[Image],
-                     function: Callable[[Image], Image]) -> Tuple[Image, ...]:
-    if len(images) < 100:
-        modified_images = []
-        for img in tqdm(images, ncols=80):
-            modified_images.append(function(img))
-        return tuple(modified_images)
-    else:
-        return tuple(process_map(function, images))
+# Custom modules loaded in this process by their paths, so each worker executes module once
+_MODULES: Dict[str, Any] = {}
 
 
 def load_custom_module(path_to_module: str) -> Optional[Any]:
@@ -33,30 +29,92 @@ def load_custom_module(path_to_module: str) -> Optional[Any]:
     return module
 
 
-def save_result(resdir: str,
-                img_names: Sequence[str],
-                ready_images: Sequence[Image]) -> None:
-    result_image_locations = tuple(os.path.join(resdir, img_name)
-                                   for img_name in img_names)
-    if len(ready_images) < 100:
-        for res_path, img in tqdm(zip(result_image_locations, ready_images), ncols=80):
-            cv2.imwrite(res_path, img)
-    else:
-        process_map(cv2.imwrite, result_image_locations, ready_images)
+def custom_module(path_to_module: str) -> Any:
+    path_to_module = os.path.abspath(path_to_module)
+    if path_to_module not in _MODULES:
+        _MODULES[path_to_module] = load_custom_module(path_to_module)
+    return _MODULES[path_to_module]
+
+
+class ApplyCustomMap:
+    """
+    Picklable worker which reads image, applies map_fn of custom module and writes result.
+    Only paths are sent to workers and only path and status are returned
+    """
+
+    def __init__(self, module_path: str, output_folder: str,
+                 target_size: Optional[Tuple[int, int]] = None) -> None:
+        self.module_path = os.path.abspath(module_path)
+        self.output_folder = os.path.abspath(output_folder)
+        self.reader = ImageReader(target_size)
+
+    def _save_image(self, img_path: str, result: Image) -> bool:
+        with stage("write"):
+            return cv2.imwrite(os.path.join(self.output_folder, os.path.basename(img_path)), result)
+
+    def __call__(self, img_path: str) -> Tuple[str, bool]:
+        image = self.reader(img_path)
+        if image is None:
+            return img_path, False
+        with stage("compute"):
+            result = custom_module(self.module_path).map_fn(image)
+        return img_path, self._save_image(img_path, result)
+
+
+class ApplyCustomMapBatch(ApplyCustomMap):
+    """
+    Read batch of images and apply map_batch_fn of custom module to each group
+    of same-sized images stacked into (N, H, W, C) array. Results are returned
+    as array or sequence of N images and written to the files of their images.
+    Without map_batch_fn map_fn is applied to images one by one
+    """
+
+    def __call__(self, img_paths: Sequence[str]) -> Sequence[Tuple[str, bool]]:
+        module = custom_module(self.module_path)
+        loaded_images = tuple(self.reader(img_path) for img_path in img_paths)
+        groups = defaultdict(list)
+        for idx, image in enumerate(loaded_images):
+            if image is not None:
+                groups[image.shape].append(idx)
+        written = [False] * len(img_paths)
+        for members in groups.values():
+            with stage("compute"):
+                if hasattr(module, "map_batch_fn"):
+                    results = module.map_batch_fn(np.stack([loaded_images[idx] for idx in members]))
+                else:
+                    results = tuple(module.map_fn(loaded_images[idx]) for idx in members)
+            if len(results) != len(members):
+                raise ValueError(f"map_batch_fn returned {len(results)} results for batch of {len(members)} images")
+            for idx, result in zip(members, results):
+                written[idx] = self._save_image(img_paths[idx], result)
+        return tuple(zip(img_paths, written))
 
 
 @print_delimiter("Apply custom preprosessing")
-def main_custom_map(imdir: str, module_path: str, resdir: str) -> None:
-    module = load_custom_module(module_path)
-    if not module:
-        typer.echo("Module not found")
+def main_custom_map(imdir: str, module_path: str, resdir: str,
+                    target_size: Optional[Tuple[int, int]] = None,
+                    batch_size: int = 1) -> None:
+    """
+    Module is loaded before workers are started, forked workers inherit it
+    and other workers load it on their first image. Module with only map_batch_fn
+    is applied to batches even if batch_size is 1
+    """
+
+    module = custom_module(module_path)
+    if not module or not (hasattr(module, "map_fn") or hasattr(module, "map_batch_fn")):
+        typer.echo("Module not found or it has neither map_fn nor map_batch_fn")
         typer.echo("Please check path to your custom module")
-        typer.Exit()
+        return
 
     create_folders((resdir, ))
-    module = load_custom_module(module_path)
-    img_names = tuple(images(imdir))
-    img_locations = tuple(os.path.join(imdir, img) for img in img_names)
-    loaded_images = tuple(cv2.imread(img) for img in img_locations)
-    modified_images = apply_custom_map(loaded_images, module.map_fn)
-    save_result(resdir, img_names, modified_images)
+    img_locations = tuple(os.path.abspath(os.path.join(imdir, img)) for img in images(imdir))
+    if batch_size > 1 or not hasattr(module, "map_fn"):
+        process_batch = ApplyCustomMapBatch(module_path, resdir, target_size)
+        batches = tuple(img_locations[idx:idx + batch_size] for idx in range(0, len(img_locations), batch_size))
+        results = (result for batch in pool_imap(process_batch, batches, ordered=False) for result in batch)
+    else:
+        process_one_image = ApplyCustomMap(module_path, resdir, target_size)
+        results = pool_imap(process_one_image, img_locations, ordered=False)
+    failed = [img_path for img_path, written in results if not written]
+    if failed:
+        typer.echo(f"{len(failed)} images were not processed, e.g. {failed[0]}")
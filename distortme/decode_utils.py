@@ -0,0 +1,224 @@
+import io
+import os
+import cv2
+import struct
+import numpy as np
+from frozendict import frozendict
+from typing import BinaryIO, NamedTuple, Optional, Tuple
+
+from distortme.base_types import Image
+from distortme.files_utils import atomic_write
+from distortme.profile_utils import stage, timed
+
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg', '.JPG', '.JPEG')
+# Start Of Frame markers hold image size. 0xC4, 0xC8 and 0xCC are not SOF
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Number of channels of PNG color types: gray, RGB, palette, gray with alpha, RGBA
+PNG_CHANNELS = frozendict({0: 1, 2: 3, 3: 3, 4: 2, 6: 4})
+REDUCED_MODES = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                 (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def jpeg_header(file: BinaryIO) -> Optional[Tuple[int, int, int]]:
+    """
+    Read (height, width, channels) of JPEG image from its header without decoding pixels
+
+    Return
+    ------
+        shape: Optional[Tuple[int, int, int]]
+            Shape of image or None if file is not a valid JPEG
+    """
+
+    if file.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = file.read(1)
+        while byte and byte != b'\xff':
+            byte = file.read(1)
+        while byte == b'\xff':
+            byte = file.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in STANDALONE_MARKERS:
+            continue
+        header = file.read(2)
+        if len(header) < 2:
+            return None
+        if marker in SOF_MARKERS:
+            data = file.read(6)
+            if len(data) < 6:
+                return None
+            _, height, width, channels = struct.unpack('>BHHB', data)
+            return height, width, channels
+        file.seek(struct.unpack('>H', header)[0] - 2, 1)
+
+
+def jpeg_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read (height, width) of JPEG image from its header without decoding pixels
+    """
+
+    with open(path, 'rb') as file:
+        shape = jpeg_header(file)
+    return shape[:2] if shape else None
+
+
+def png_header(data: bytes) -> Optional[Tuple[int, int, int]]:
+    """
+    Read (height, width, channels) of PNG image from its IHDR chunk
+    """
+
+    if len(data) < 26 or data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        return None
+    width, height, _, color_type = struct.unpack('>IIBB', data[16:26])
+    return height, width, PNG_CHANNELS.get(color_type, 3)
+
+
+def encoded_info(data: bytes, name: str = "") -> Tuple[str, Tuple[int, ...]]:
+    """
+    Format and shape of encoded image. Shape is read from header of JPEG and PNG,
+    other formats are decoded.
+
+    Parameters
+    ----------
+        data: bytes
+            Content of image file
+
+        name: str
+            Name of file, its extension is the format of unknown images
+
+    Return
+    ------
+        format, shape: Tuple[str, Tuple[int, ...]]
+            Format of image and its (height, width, channels), zeros if image can't be decoded
+    """
+
+    shape = jpeg_header(io.BytesIO(data))
+    if shape is not None:
+        return "jpeg", shape
+    shape = png_header(data)
+    if shape is not None:
+        return "png", shape
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        shape = (0, 0, 0)
+    else:
+        shape = image.shape[:2] + ((image.shape[2], ) if image.ndim == 3 else (1, ))
+    return os.path.splitext(name)[1].lstrip('.').lower(), shape
+
+
+class EncodedImage(NamedTuple):
+    """
+    Content of image file with metadata read from its header
+
+    Parameters
+    ----------
+        data: np.ndarray
+            Bytes of file as uint8 array
+
+        format: str
+            Format of image: jpeg, png or extension of file
+
+        shape: Tuple[int, ...]
+            (height, width, channels) of image
+    """
+
+    data: np.ndarray
+    format: str
+    shape: Tuple[int, ...]
+
+
+@timed("decode")
+def read_encoded(path: str) -> EncodedImage:
+    """
+    Read image file without decoding pixels
+    """
+
+    with open(path, 'rb') as file:
+        data = file.read()
+    img_format, shape = encoded_info(data, path)
+    return EncodedImage(np.frombuffer(data, dtype=np.uint8), img_format, shape)
+
+
+def decode_bytes(data: np.ndarray, flags: int = cv2.IMREAD_COLOR) -> Image:
+    with stage("decode"):
+        return cv2.imdecode(data, flags)
+
+
+def reduce_factor(src_size: Tuple[int, int], target_size: Tuple[int, int]) -> int:
+    """
+    Largest JPEG scale denominator that keeps decoded image not smaller than target.
+    Sides are compared regardless of orientation, because decoder may apply EXIF rotation.
+    """
+
+    src_side, target_side = min(src_size), max(target_size)
+    for factor, _ in REDUCED_MODES:
+        if src_side // factor >= target_side:
+            return factor
+    return 1
+
+
+@timed("decode")
+def read_image(path: str, target_size: Optional[Tuple[int, int]] = None) -> Image:
+    """
+    Decode image. If image is a JPEG at least twice as large as target_size,
+    decode it at 1/2, 1/4 or 1/8 resolution to skip pixels that are dropped by resize.
+
+    Parameters
+    ----------
+        path: str
+            Path to image
+
+        target_size: Optional[Tuple[int, int]]
+            (height, width) to which image will be resized after decoding
+
+    Return
+    ------
+        image: Image
+            Decoded BGR image not smaller than target_size
+    """
+
+    if target_size is None or not path.endswith(JPEG_EXTENSIONS):
+        return cv2.imread(path)
+    src_size = jpeg_size(path)
+    factor = reduce_factor(src_size, target_size) if src_size else 1
+    return cv2.imread(path, dict(REDUCED_MODES).get(factor, cv2.IMREAD_COLOR))
+
+
+def resize_image(image: Image, target_size: Tuple[int, int]) -> Image:
+    height, width = target_size
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def write_image(path: str, image: Image) -> None:
+    """
+    Encode image according to extension of path and write it atomically
+    """
+
+    with stage("encode"):
+        success, encoded = cv2.imencode(os.path.splitext(path)[1], image)
+    if not success:
+        raise ValueError(f"Can't encode image to {path}")
+    with stage("write"):
+        atomic_write(path, encoded.tobytes())
+
+
+class ImageReader:
+    """
+    Picklable reader which decodes image and resizes it to target_size if it is provided
+    """
+
+    def __init__(self, target_size: Optional[Tuple[int, int]] = None) -> None:
+        self.target_size = target_size
+
+    def __call__(self, path: str) -> Image:
+        image = read_image(path, self.target_size)
+        if self.target_size is None or image is None:
+            return image
+        with stage("compute"):
+            return resize_image(image, self.target_size)
@@ -1,4 +1,6 @@
 import os
+import hashlib
+import tempfile
 from typing import Iterator, Sequence, Tuple, Optional
 
 
@@ -25,3 +27,31 @@ def create_folders(names: Sequence[str]) -> None:
     missed_folders = filter(lambda x: not os.path.exists(x), names)
     for folder in missed_folders:
         os.mkdir(folder)
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write data to temporary file in the same folder and rename it to path,
+    so path never contains truncated data
+    """
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.",
+                                    suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_digest(path: str) -> bytes:
+    """
+    Hex digest of file content, used to find files which are already stored
+    """
+
+    with open(path, 'rb') as file:
+        return hashlib.blake2b(file.read(), digest_size=16).hexdigest().encode()
@@ -0,0 +1,170 @@
+import zlib
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from distortme.base_types import Image, ImageShape
+from distortme.decode_utils import read_image
+from distortme.hdf5_options import Codec, BATCHED_CHUNK_BYTES
+from distortme.profile_utils import stage
+
+
+@dataclass(frozen=True)
+class Compression:
+    """
+    Filters applied to image datasets of HDF5 file
+
+    Parameters
+    ----------
+        codec: Codec
+            Compression filter. lzf is available only inside of HDF5 library,
+            so it is always applied by writer
+
+        level: int
+            Level of gzip compression from 0 to 9
+
+        shuffle: bool
+            Apply byte shuffle filter before compression
+    """
+
+    codec: Codec = Codec.gzip
+    level: int = 4
+    shuffle: bool = False
+
+    def __str__(self) -> str:
+        name = f"gzip{self.level}" if self.codec == Codec.gzip else self.codec.value
+        return name + "+shuffle" if self.shuffle else name
+
+    def dataset_options(self) -> Dict[str, Any]:
+        return {"compression": None if self.codec == Codec.none else self.codec.value,
+                "compression_opts": self.level if self.codec == Codec.gzip else None,
+                "shuffle": self.shuffle}
+
+    @property
+    def contiguous(self) -> bool:
+        """
+        No filters are applied, so dataset is stored contiguously and may be memory mapped
+        """
+
+        return self.codec == Codec.none and not self.shuffle
+
+    @property
+    def in_workers(self) -> bool:
+        """
+        Filters can be applied without HDF5 library, so chunks are compressed
+        by workers and written with write_direct_chunk
+        """
+
+        return not self.contiguous and self.codec in (Codec.none, Codec.gzip)
+
+    def compress(self, chunk: np.ndarray) -> bytes:
+        """
+        Apply filters to one chunk the same way HDF5 filter pipeline does
+        """
+
+        data = np.ascontiguousarray(chunk)
+        if self.shuffle and data.itemsize > 1:
+            data = data.view(np.uint8).reshape(-1, data.itemsize).T
+        raw = data.tobytes()
+        return zlib.compress(raw, self.level) if self.codec == Codec.gzip else raw
+
+
+# Compressions compared by 'distortme tohd5 --benchmark-codecs'
+CODEC_CANDIDATES = (Compression(Codec.none),
+                    Compression(Codec.lzf),
+                    Compression(Codec.gzip, 1),
+                    Compression(Codec.gzip, 4),
+                    Compression(Codec.gzip, 6),
+                    Compression(Codec.gzip, 9))
+
+
+class CompressedChunk(NamedTuple):
+    """
+    Filtered bytes of one chunk of dataset
+
+    Parameters
+    ----------
+        data: bytes
+            Chunk after filters are applied
+
+        shape: Tuple[int, ...]
+            Shape of chunk
+
+        dtype: str
+            Type of elements of dataset
+
+        count: int
+            Number of images in chunk
+
+        error: Optional[str]
+            Description of image which can't be written into dataset
+    """
+
+    data: bytes
+    shape: Tuple[int, ...]
+    dtype: str
+    count: int
+    error: Optional[str] = None
+
+
+def batched_chunk_len(image: Image, total: int, chunks: Optional[int] = None) -> int:
+    """
+    Number of images in one chunk of batched dataset: given by user or about BATCHED_CHUNK_BYTES
+    """
+
+    if chunks is not None:
+        return max(1, min(total, chunks))
+    return max(1, min(total, BATCHED_CHUNK_BYTES // image.nbytes))
+
+
+class CompressImage:
+    """
+    Decode image and compress it as the only chunk of its dataset
+    """
+
+    def __init__(self, compression: Compression) -> None:
+        self.compression = compression
+
+    def __call__(self, path: str) -> CompressedChunk:
+        image = read_image(path)
+        with stage("encode"):
+            return CompressedChunk(self.compression.compress(image), image.shape, image.dtype.str, 1)
+
+
+class CompressChunk:
+    """
+    Decode images of one chunk of batched dataset and compress them together.
+    Last chunk is padded with zeros, as HDF5 stores edge chunks in full size.
+
+    Parameters
+    ----------
+        compression: Compression
+            Filters of dataset
+
+        shape: ImageShape
+            Shape all images must have
+
+        dtype: str
+            Type of elements of dataset
+
+        chunk_len: int
+            Number of images in one chunk
+    """
+
+    def __init__(self, compression: Compression, shape: ImageShape, dtype: str, chunk_len: int) -> None:
+        self.compression = compression
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.chunk_len = chunk_len
+
+    def __call__(self, paths: Sequence[str]) -> CompressedChunk:
+        chunk = np.zeros((self.chunk_len, ) + self.shape, dtype=self.dtype)
+        for idx, path in enumerate(paths):
+            image = read_image(path)
+            if image.shape != self.shape:
+                return CompressedChunk(b"", chunk.shape, self.dtype, 0,
+                                       f"Image {path} has shape {image.shape}, "
+                                       f"but batched layout requires {self.shape} for all images")
+            chunk[idx] = image
+        with stage("encode"):
+            return CompressedChunk(self.compression.compress(chunk), chunk.shape, self.dtype, len(paths))
@@ -0,0 +1,54 @@
+from enum import Enum
+
+
+class Layout(str, Enum):
+    """
+    per_image: one dataset data_<name> and label_<name> for each image
+    batched:   one (N, H, W, C) dataset 'images' with (N, ) 'labels' and 'names',
+               all images must have the same shape
+    """
+
+    per_image = "per-image"
+    batched = "batched"
+
+
+class Storage(str, Enum):
+    """
+    pixels:  decoded images
+    encoded: bytes of image files as they are with their format and shape, decoded on read
+    """
+
+    pixels = "pixels"
+    encoded = "encoded"
+
+
+class Match(str, Enum):
+    """
+    Images skipped by 'tohd5 --append' when they are already in file
+    name:    image with the same file name
+    content: image file with the same content hash
+    """
+
+    name = "name"
+    content = "content"
+
+
+# Names of datasets of batched layout
+IMAGES_DATASET = "images"
+LABELS_DATASET = "labels"
+NAMES_DATASET = "names"
+SHAPES_DATASET = "shapes"
+FORMATS_DATASET = "formats"
+# Index of images of both layouts: (N, ) 'names' and hex digests of image files
+HASHES_DATASET = "hashes"
+# Number of encoded images written at once in batched layout
+ENCODED_WRITE_BATCH = 256
+# Minimal size of one chunk of batched images dataset in bytes. Chunk is read and
+# decompressed as a whole, so chunks of about one image keep random access cheap
+BATCHED_CHUNK_BYTES = 16 * 1024
+
+
+class Codec(str, Enum):
+    none = "none"
+    lzf = "lzf"
+    gzip = "gzip"
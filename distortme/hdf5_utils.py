@@ -1,15 +1,29 @@
 import os
 import cv2
+import time
 import h5py
 import typer
+import tempfile
 import numpy as np
 import pandas as pd
-import multiprocessing as mp
-from typing import Sequence, Tuple
+from itertools import repeat
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
 
 from distortme.base_types import Labels, Image
-from distortme.files_utils import images, create_folders
+from distortme.files_utils import images, create_folders, file_digest
+from distortme.hdf5_options import (Layout, Match, Storage, IMAGES_DATASET, LABELS_DATASET, NAMES_DATASET,
+                                    SHAPES_DATASET, FORMATS_DATASET, HASHES_DATASET, ENCODED_WRITE_BATCH)
+from distortme.hdf5_compression import (Compression, CompressedChunk, CompressChunk, CompressImage,
+                                        CODEC_CANDIDATES, batched_chunk_len)
 from distortme.main_utils import print_delimiter
+from distortme.pool_utils import POOL_CONFIG, InFlightLimit, get_chunksize, get_pool, pool_imap, pool_map
+from distortme.profile_utils import stage
+from distortme.decode_utils import EncodedImage, decode_bytes, read_encoded, read_image
+
+
+# Decoded image, image compressed by worker or content of image file
+ImageData = Union[Image, CompressedChunk, EncodedImage]
 
 
 def read_labels_npy(path: str) -> Labels:
@@ -24,9 +38,25 @@ def read_labels_csv(path: str) -> Labels:
     return pd.read_csv(path).values.reshape(-1, 1)
 
 
-def load_images(img_locations: Tuple[str, ...]) -> Tuple[Image, ...]:
-    pool = mp.Pool(mp.cpu_count())
-    return tuple(pool.map(cv2.imread, img_locations))
+def stream_results(function: Callable[[Any], Any], tasks: Tuple[Any, ...], inflight: int) -> Iterator[Any]:
+    """
+    Process tasks (e.g. decode images) in workers and yield results in order. Not more than
+    inflight results are computed and not yet consumed, so memory use doesn't depend on dataset size
+    """
+
+    limit = InFlightLimit(tasks, inflight)
+    chunksize = min(get_chunksize(len(tasks)), max(1, inflight // (2 * POOL_CONFIG.workers)))
+    results = pool_imap(function, limit, total=len(tasks), chunksize=chunksize)
+    try:
+        for result in results:
+            yield result
+            limit.release()
+    finally:
+        limit.close()
+        # Finish already submitted tasks instead of terminating pool:
+        # terminate may hang while workers are blocked sending large images
+        for _ in results:
+            pass
 
 
 def load_labels(path: str) -> Labels:
@@ -41,65 +71,537 @@ def load_labels(path: str) -> Labels:
         raise NotImplementedError
 
 
+def write_image_dataset(hf: h5py.File, name: str, img: ImageData, compression: Compression) -> None:
+    """
+    Write image as dataset of one chunk. Image compressed by worker is written as is,
+    content of image file is written as uint8 dataset with its format and shape in attributes
+    """
+
+    if isinstance(img, EncodedImage):
+        with stage("write"):
+            dataset = hf.create_dataset(name=name, data=img.data)
+        dataset.attrs["format"] = img.format
+        dataset.attrs["shape"] = img.shape
+    elif isinstance(img, CompressedChunk):
+        dataset = hf.create_dataset(name=name, shape=img.shape, dtype=img.dtype, chunks=img.shape,
+                                    **compression.dataset_options())
+        with stage("write"):
+            dataset.id.write_direct_chunk((0, ) * len(img.shape), img.data)
+    else:
+        with stage("write"):
+            hf.create_dataset(name=name, data=img, chunks=None if compression.contiguous else img.shape,
+                              **compression.dataset_options())
+
+
+def write_per_image(hf: h5py.File,
+                    img_names: Tuple[str, ...],
+                    img_data: Iterable[ImageData],
+                    labels: Labels = None,
+                    compression: Compression = Compression()) -> None:
+    options = compression.dataset_options()
+    for img_name, img, label in zip(img_names, img_data, repeat(None) if labels is None else labels):
+        write_image_dataset(hf, f"data_{img_name}", img, compression)
+        if label is not None:
+            hf.create_dataset(
+                name=f"label_{img_name.split('.')[0]}",
+                data=label,
+                shape=(1, ),
+                maxshape=(None, ),
+                **options
+            )
+
+
+def extend_dataset(hf: h5py.File, name: str, data: Any, dtype: Any = None) -> int:
+    """
+    Append rows to resizable dataset or create it if file has none. Returns number of rows before append
+    """
+
+    if name not in hf:
+        hf.create_dataset(name, data=data, dtype=dtype, maxshape=(None, ) + np.shape(data)[1:])
+        return 0
+    dataset = hf[name]
+    offset = len(dataset)
+    dataset.resize(offset + len(data), axis=0)
+    dataset[offset:] = data
+    return offset
+
+
+def write_index(hf: h5py.File,
+                img_names: Tuple[str, ...],
+                labels: Labels = None,
+                hashes: Optional[Sequence[bytes]] = None) -> int:
+    """
+    Write or extend names, labels and hashes of batched layout. Returns number of images before append
+    """
+
+    if labels is not None:
+        if len(labels) < len(img_names):
+            raise ValueError(f"Found {len(labels)} labels for {len(img_names)} images")
+        extend_dataset(hf, LABELS_DATASET, np.asarray(labels).reshape(-1)[:len(img_names)])
+    offset = extend_dataset(hf, NAMES_DATASET, img_names, h5py.string_dtype())
+    if hashes is not None:
+        extend_dataset(hf, HASHES_DATASET, hashes)
+    hf.attrs["layout"] = Layout.batched.value
+    return offset
+
+
+def truncate_batched(hf: h5py.File, length: int) -> None:
+    """
+    Remove images appended after first length images of batched layout
+    """
+
+    for name in (IMAGES_DATASET, LABELS_DATASET, NAMES_DATASET, HASHES_DATASET, SHAPES_DATASET, FORMATS_DATASET):
+        if name in hf and len(hf[name]) > length:
+            hf[name].resize(length, axis=0)
+
+
+def write_batched(hf: h5py.File,
+                  img_names: Tuple[str, ...],
+                  img_data: Iterable[ImageData],
+                  labels: Labels = None,
+                  compression: Compression = Compression(),
+                  chunks: Optional[int] = None,
+                  hashes: Optional[Sequence[bytes]] = None) -> None:
+    """
+    Write all images into one chunked (N, H, W, C) dataset or append them to existing one.
+    Decoded images are collected into buffer of one chunk, so each chunk is compressed
+    and written once. Chunks compressed by workers are written as is.
+    """
+
+    offset = write_index(hf, img_names, labels, hashes)
+    total = offset + len(img_names)
+    options = compression.dataset_options()
+    dataset, buffer, start = None, None, offset
+    if IMAGES_DATASET in hf:
+        dataset = hf[IMAGES_DATASET]
+        dataset.resize(total, axis=0)
+        buffer = np.empty((dataset.chunks[0], ) + dataset.shape[1:], dtype=dataset.dtype)
+    for idx, img in enumerate(img_data):
+        if isinstance(img, CompressedChunk):
+            if img.error is not None:
+                raise ValueError(img.error)
+            if dataset is None:
+                dataset = hf.create_dataset(IMAGES_DATASET, shape=(total, ) + img.shape[1:], dtype=img.dtype,
+                                            maxshape=(None, ) + img.shape[1:], chunks=img.shape, **options)
+            with stage("write"):
+                dataset.id.write_direct_chunk((start, ) + (0, ) * (len(img.shape) - 1), img.data)
+            start += img.count
+            continue
+
+        if dataset is None:
+            chunk_len = batched_chunk_len(img, len(img_names), chunks)
+            contiguous = compression.contiguous and chunks is None
+            dataset = hf.create_dataset(IMAGES_DATASET, shape=(total, ) + img.shape, dtype=img.dtype,
+                                        maxshape=None if contiguous else (None, ) + img.shape,
+                                        chunks=None if contiguous else (chunk_len, ) + img.shape, **options)
+            buffer = np.empty((chunk_len, ) + img.shape, dtype=img.dtype)
+        if img.shape != dataset.shape[1:]:
+            raise ValueError(f"Image {img_names[idx]} has shape {img.shape}, "
+                             f"but batched layout requires {dataset.shape[1:]} for all images")
+        # Buffer is flushed at chunk boundaries, so appended images fill partial chunk first
+        position = offset + idx
+        buffer[position - start] = img
+        if (position + 1) % len(buffer) == 0:
+            with stage("write"):
+                dataset[start:position + 1] = buffer[:position + 1 - start]
+            start = position + 1
+    if buffer is not None and start < total:
+        with stage("write"):
+            dataset[start:total] = buffer[:total - start]
+
+
+def write_encoded_batched(hf: h5py.File,
+                          img_names: Tuple[str, ...],
+                          img_data: Iterable[EncodedImage],
+                          labels: Labels = None,
+                          hashes: Optional[Sequence[bytes]] = None) -> None:
+    """
+    Write content of image files into one (N, ) dataset of variable-length uint8 arrays
+    with (N, 3) shapes and (N, ) formats or append them to existing datasets.
+    Files are already compressed, so no filters are used.
+    """
+
+    offset = write_index(hf, img_names, labels, hashes)
+    total = offset + len(img_names)
+    if IMAGES_DATASET in hf:
+        images_dataset, shapes_dataset, formats_dataset = hf[IMAGES_DATASET], hf[SHAPES_DATASET], hf[FORMATS_DATASET]
+        for dataset in (images_dataset, shapes_dataset, formats_dataset):
+            dataset.resize(total, axis=0)
+    else:
+        images_dataset = hf.create_dataset(IMAGES_DATASET, shape=(total, ), maxshape=(None, ),
+                                           dtype=h5py.vlen_dtype(np.uint8))
+        shapes_dataset = hf.create_dataset(SHAPES_DATASET, shape=(total, 3), maxshape=(None, 3), dtype=np.int32)
+        formats_dataset = hf.create_dataset(FORMATS_DATASET, shape=(total, ), maxshape=(None, ),
+                                            dtype=h5py.string_dtype())
+
+    def flush(buffer: Sequence[EncodedImage], start: int) -> None:
+        data = np.empty(len(buffer), dtype=object)
+        for idx, img in enumerate(buffer):
+            data[idx] = img.data
+        with stage("write"):
+            # h5py stacks files of equal size into 2D array and fails to write them as one slice
+            if len(set(len(img.data) for img in buffer)) == 1:
+                for idx, img in enumerate(buffer):
+                    images_dataset[start + idx] = img.data
+            else:
+                images_dataset[start:start + len(buffer)] = data
+            shapes_dataset[start:start + len(buffer)] = [img.shape for img in buffer]
+            formats_dataset[start:start + len(buffer)] = [img.format for img in buffer]
+
+    buffer, start = [], offset
+    for img in img_data:
+        buffer.append(img)
+        if len(buffer) == ENCODED_WRITE_BATCH:
+            flush(buffer, start)
+            start, buffer = start + len(buffer), []
+    if buffer:
+        flush(buffer, start)
+
+
 def save_to_hdf5(result_name: str,
                  img_names: Tuple[str, ...],
-                 img_data: Tuple[Image, ...],
-                 labels: Labels = None) -> None:
-    with h5py.File(f'{result_name}.h5', 'w') as hf:
-        if labels is None:
-            for img_name, img in zip(img_names, img_data):
-                compressed_data = hf.create_dataset(
-                    name=f"data_{img_name}",
-                    data=img,
-                    shape=(img.shape[0], img.shape[1], img.shape[2]),
-                    maxshape=(img.shape[0], img.shape[1], img.shape[2]),
-                    compression='gzip',
-                    compression_opts=9
-                )
-        else:
-            for img_name, img, label in zip(img_names, img_data, labels):
-                compressed_data = hf.create_dataset(
-                    name=f"data_{img_name}",
-                    data=img,
-                    shape=(img.shape[0], img.shape[1], img.shape[2]),
-                    maxshape=(img.shape[0], img.shape[1], img.shape[2]),
-                    compression='gzip',
-                    compression_opts=9
-                )
-                compressed_labels = hf.create_dataset(
-                    name=f"label_{img_name.split('.')[0]}",
-                    data=label,
-                    shape=(1, ),
-                    maxshape=(None, ),
-                    compression='gzip',
-                    compression_opts=9
-                )
-
-
-def extract_from_hdf5(path: str) -> None:
+                 img_data: Iterable[ImageData],
+                 labels: Labels = None,
+                 layout: Layout = Layout.per_image,
+                 compression: Compression = Compression(),
+                 chunks: Optional[int] = None,
+                 storage: Storage = Storage.pixels,
+                 hashes: Optional[Sequence[bytes]] = None,
+                 append: bool = False) -> None:
+    """
+    Write images into new file or append them to existing one. On error appended
+    images of batched layout are removed, so file keeps its previous content
+    """
+
+    with h5py.File(f'{result_name}.h5', 'a' if append else 'w') as hf:
+        length = len(hf[NAMES_DATASET]) if NAMES_DATASET in hf else 0
+        hf.attrs["storage"] = storage.value
+        try:
+            if layout == Layout.batched and storage == Storage.encoded:
+                write_encoded_batched(hf, img_names, img_data, labels, hashes)
+            elif layout == Layout.batched:
+                write_batched(hf, img_names, img_data, labels, compression, chunks, hashes)
+            else:
+                write_per_image(hf, img_names, img_data, labels, compression)
+                if hashes is not None:
+                    extend_dataset(hf, NAMES_DATASET, img_names, h5py.string_dtype())
+                    extend_dataset(hf, HASHES_DATASET, hashes)
+        except ValueError:
+            if layout == Layout.batched:
+                truncate_batched(hf, length)
+            raise
+
+
+def write_file(path: str, data: np.ndarray) -> None:
+    with open(path, 'wb') as file:
+        file.write(data.tobytes())
+
+
+class ExtractSlice(NamedTuple):
+    """
+    Images of one HDF5 file extracted by one worker: keys of per-image layout
+    or range of indices of batched layout
+    """
+
+    path: str
+    data_dir: str
+    start: int = 0
+    stop: int = 0
+    keys: Tuple[str, ...] = ()
+
+
+def extract_slice(task: ExtractSlice) -> int:
+    with h5py.File(task.path, 'r') as hf:
+        if task.keys:
+            for key in task.keys:
+                dataset = hf[key]
+                if "format" in dataset.attrs:
+                    write_file(os.path.join(task.data_dir, key), dataset[()])
+                else:
+                    cv2.imwrite(os.path.join(task.data_dir, key), dataset[()])
+            return len(task.keys)
+
+        names = hf[NAMES_DATASET].asstr()[task.start:task.stop]
+        encoded = hf.attrs.get("storage") == Storage.encoded.value
+        for name, img in zip(names, hf[IMAGES_DATASET][task.start:task.stop]):
+            if encoded:
+                write_file(os.path.join(task.data_dir, name), img)
+            else:
+                cv2.imwrite(os.path.join(task.data_dir, name), img)
+    return len(names)
+
+
+def write_labels(path: str, keys: Sequence[str], labels: np.ndarray) -> None:
+    rows = (" ".join(row) for row in labels.reshape(len(keys), -1).astype(str))
+    with open(path, 'w') as labels_file:
+        labels_file.write("".join(f"{key}: [{row}]\n" for key, row in zip(keys, rows)))
+
+
+def extract_tasks(path: str) -> Tuple[ExtractSlice, ...]:
+    """
+    Create folders, write labels and split images of file into slices for workers.
+    Slices of batched layout are aligned to chunks, so each chunk is decompressed once
+    """
+
     filename = os.path.basename(path)
+    data_dir, labels_dir = f'data_{filename.replace(".", "_")}', f'labels_{filename.replace(".", "_")}'
+    create_folders((data_dir, labels_dir))
+    path, data_dir = os.path.abspath(path), os.path.abspath(data_dir)
     with h5py.File(path, 'r') as hf:
+        if hf.attrs.get("layout") == Layout.batched.value:
+            names = hf[NAMES_DATASET].asstr()[()]
+            if LABELS_DATASET in hf:
+                keys = tuple(f"label_{name.split('.')[0]}" for name in names)
+                write_labels(os.path.join(labels_dir, 'labels.txt'), keys, hf[LABELS_DATASET][()])
+            dataset = hf[IMAGES_DATASET]
+            step = dataset.chunks[0] if dataset.chunks and hf.attrs.get("storage") != Storage.encoded.value else 1
+            size = -(-get_chunksize(len(names)) // step) * step
+            return tuple(ExtractSlice(path, data_dir, start, min(start + size, len(names)))
+                         for start in range(0, len(names), size))
+
         all_instances = tuple(hf.keys())
         labels = tuple(filter(lambda x: x.split('_')[0] == 'label', all_instances))
         data = tuple(filter(lambda x: x.split('_')[0] == 'data', all_instances))
-        create_folders((f'data_{filename.replace(".", "_")}', f'labels_{filename.replace(".", "_")}'))
-        for image in data:
-            cv2.imwrite(os.path.join(f'data_{filename.replace(".", "_")}', f'{image}'), np.array(hf[image]))
+        if len(labels) > 0:
+            values = np.concatenate([hf[label][()].reshape(1, -1) for label in labels])
+            write_labels(os.path.join(labels_dir, 'labels.txt'), labels, values)
+    size = get_chunksize(len(data))
+    return tuple(ExtractSlice(path, data_dir, keys=data[start:start + size]) for start in range(0, len(data), size))
 
-        if len(labels) == 0:
-            return
 
-        with open(f'labels_{filename.replace(".", "_")}/labels.txt', 'w') as labels_file:
-            for label in labels:
-                labels_file.write(f'{label}: {str(np.array(hf[label]))}')
-                labels_file.write('\n')
+class HDF5Dataset:
+    """
+    Random access reader of HDF5 files created by 'distortme tohd5' with any layout and storage.
+    Each process opens its own read-only handle on first access, so the reader
+    may be passed to DataLoader workers as is. Uncompressed contiguous images
+    of batched layout are read from memory map without copies.
+
+    Parameters
+    ----------
+        path: str
+            Path to .h5 file
+
+        cache_size: int
+            Number of recently read images kept by each process. Cached images
+            are shared between calls and must not be modified
+
+        flags: int
+            Flags passed to cv2.imdecode for encoded storage
+
+    Example
+    -------
+        dataset = HDF5Dataset("images.h5", cache_size=1024)
+        image, label = dataset[0]
+        images, labels = dataset.get_batch([5, 1, 7])
+        loader = torch.utils.data.DataLoader(dataset, batch_size=64, num_workers=8)
+    """
+
+    def __init__(self, path: str, cache_size: int = 0, flags: int = cv2.IMREAD_COLOR) -> None:
+        self.path = path
+        self.cache_size = cache_size
+        self.flags = flags
+        self._pid: Optional[int] = None
+        self._file: Optional[h5py.File] = None
+        self._memmap: Optional[np.ndarray] = None
+        self._cache: OrderedDict = OrderedDict()
+        with h5py.File(path, 'r') as hf:
+            self.layout = Layout(hf.attrs.get("layout", Layout.per_image.value))
+            self.storage = Storage(hf.attrs.get("storage", Storage.pixels.value))
+            if self.layout == Layout.batched:
+                self.names = tuple(hf[NAMES_DATASET].asstr()[()])
+                self.labels = hf[LABELS_DATASET][()] if LABELS_DATASET in hf else None
+                dataset = hf[IMAGES_DATASET]
+                mappable = dataset.chunks is None and self.storage == Storage.pixels
+                self._offset = dataset.id.get_offset() if mappable else None
+                self._shape, self._dtype = dataset.shape, dataset.dtype
+            else:
+                self._keys = tuple(sorted(key for key in hf.keys() if key.startswith("data_")))
+                self.names = tuple(key[len("data_"):] for key in self._keys)
+                label_keys = tuple(f"label_{name.split('.')[0]}" for name in self.names)
+                has_labels = len(label_keys) > 0 and all(key in hf for key in label_keys)
+                self.labels = np.concatenate([hf[key][()] for key in label_keys]) if has_labels else None
+                self._offset = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.update(_pid=None, _file=None, _memmap=None, _cache=OrderedDict())
+        return state
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _handle(self) -> h5py.File:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._file = h5py.File(self.path, 'r')
+            self._cache = OrderedDict()
+            if self._offset is not None:
+                self._memmap = np.memmap(self.path, dtype=self._dtype, mode='r',
+                                         offset=self._offset, shape=self._shape)
+        return self._file
+
+    def close(self) -> None:
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._pid, self._file, self._memmap = None, None, None
+
+    def _read(self, index: int) -> Image:
+        hf = self._handle()
+        if self._memmap is not None:
+            return self._memmap[index]
+        if self.layout == Layout.batched:
+            data = hf[IMAGES_DATASET][index]
+            return decode_bytes(data, self.flags) if self.storage == Storage.encoded else data
+        dataset = hf[self._keys[index]]
+        return decode_bytes(dataset[()], self.flags) if "format" in dataset.attrs else dataset[()]
+
+    def _read_runs(self, indices: Sequence[int]) -> Dict[int, Image]:
+        """
+        Read images of batched pixel layout: consecutive indices are read with one slice
+        """
+
+        if self._memmap is None and (self.layout != Layout.batched or self.storage == Storage.encoded):
+            return {index: self._read(index) for index in indices}
+        source = self._memmap if self._memmap is not None else self._handle()[IMAGES_DATASET]
+        result, ordered = {}, sorted(set(indices))
+        start = 0
+        for end in range(1, len(ordered) + 1):
+            if end < len(ordered) and ordered[end] == ordered[end - 1] + 1:
+                continue
+            first, last = ordered[start], ordered[end - 1]
+            result.update(zip(range(first, last + 1), source[first:last + 1]))
+            start = end
+        return result
+
+    def _cached(self, indices: Sequence[int]) -> Tuple[Image, ...]:
+        indices = tuple(index + len(self) if index < 0 else index for index in indices)
+        if any(index < 0 or index >= len(self) for index in indices):
+            raise IndexError(f"Index out of range for dataset of {len(self)} images")
+        self._handle()
+        missing = tuple(index for index in indices if index not in self._cache)
+        images = self._read_runs(missing) if missing else {}
+        result = tuple(images[index] if index in images else self._cache[index] for index in indices)
+        if self.cache_size > 0:
+            for index, image in zip(indices, result):
+                self._cache[index] = image
+                self._cache.move_to_end(index)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def __getitem__(self, index: int) -> Union[Image, Tuple[Image, Any]]:
+        """
+        Image or pair of image and label if file has labels
+        """
+
+        image = self._cached((index, ))[0]
+        return image if self.labels is None else (image, self.labels[index])
+
+    def get_batch(self, indices: Sequence[int]) -> Tuple[Union[np.ndarray, Tuple[Image, ...]], Optional[np.ndarray]]:
+        """
+        Images and labels of indices. Images are stacked into one array if they have the same shape
+        """
+
+        images = self._cached(indices)
+        if len(set(image.shape for image in images)) == 1:
+            images = np.stack(images)
+        labels = None if self.labels is None else self.labels[np.asarray(indices, dtype=np.int64)]
+        return images, labels
+
+
+class AppendPlan(NamedTuple):
+    """
+    Layout and storage of existing file, indices of images which are not in file yet
+    and their hashes if file has index of hashes
+    """
+
+    layout: Layout
+    storage: Storage
+    keep: np.ndarray
+    hashes: Optional[Tuple[bytes, ...]]
+
+
+def plan_append(path: str,
+                img_locations: Tuple[str, ...],
+                labels: Labels,
+                match: Match) -> AppendPlan:
+    """
+    Find images which are not in file by name or content. Only index of file is read
+    and only files with new names are hashed when matching by name, so time depends
+    on number of new images. Duplicates among new images are skipped as well
+    """
+
+    with h5py.File(path, 'r') as hf:
+        layout = Layout(hf.attrs.get("layout", Layout.per_image.value))
+        storage = Storage(hf.attrs.get("storage", Storage.pixels.value))
+        indexed = HASHES_DATASET in hf
+        if match == Match.content and not indexed:
+            raise ValueError(f"{path} has no index of content hashes, use --match name")
+        if layout == Layout.batched:
+            if IMAGES_DATASET in hf and hf[IMAGES_DATASET].maxshape[0] is not None:
+                raise ValueError(f"Images of {path} were written without chunks and can't be extended")
+            if (LABELS_DATASET in hf) != (labels is not None):
+                raise ValueError(f"Labels must be given for all images of {path} or for none of them")
+        if NAMES_DATASET in hf:
+            names = set(hf[NAMES_DATASET].asstr()[()])
+        else:
+            names = set(key[len("data_"):] for key in hf.keys() if key.startswith("data_"))
+        known = set(hf[HASHES_DATASET][()]) if indexed else set()
+
+    img_names = tuple(os.path.basename(location) for location in img_locations)
+    candidates = tuple(idx for idx, name in enumerate(img_names) if match == Match.content or name not in names)
+    hashes = pool_map(file_digest, tuple(img_locations[idx] for idx in candidates), desc="Hash") if indexed else ()
+    keep, kept_hashes = [], []
+    for idx, digest in zip(candidates, hashes or repeat(None)):
+        name = img_names[idx]
+        new = name not in names if match == Match.name else digest not in known
+        # Per-image layout can't have two datasets with the same name
+        if layout == Layout.per_image:
+            new = new and name not in names
+        if new:
+            keep.append(idx)
+            kept_hashes.append(digest)
+            names.add(name)
+            known.add(digest)
+    return AppendPlan(layout, storage, np.array(keep, dtype=np.int64), tuple(kept_hashes) if indexed else None)
+
+
+def image_tasks(img_locations: Tuple[str, ...],
+                layout: Layout,
+                compression: Compression,
+                chunks: Optional[int],
+                storage: Storage = Storage.pixels,
+                append: bool = False) -> Tuple[Callable[[Any], ImageData], Tuple[Any, ...], int]:
+    """
+    Function executed by workers, its tasks and number of images in one task.
+    Gzip and uncompressed chunks are prepared by workers, so writer only copies bytes.
+    Images appended to batched layout are compressed by writer with filters of existing dataset.
+    """
+
+    if storage == Storage.encoded:
+        return read_encoded, img_locations, 1
+    if not compression.in_workers or not img_locations:
+        return read_image, img_locations, 1
+    if layout == Layout.per_image:
+        return CompressImage(compression), img_locations, 1
+    if append:
+        return read_image, img_locations, 1
+    first = read_image(img_locations[0])
+    chunk_len = batched_chunk_len(first, len(img_locations), chunks)
+    tasks = tuple(img_locations[start:start + chunk_len] for start in range(0, len(img_locations), chunk_len))
+    return CompressChunk(compression, first.shape, first.dtype.str, chunk_len), tasks, chunk_len
 
 
 @print_delimiter("Create HDF5 dataset from images...")
-def main_save_to_hdf5(imdir: str, labels: str) -> None:
+def main_save_to_hdf5(imdir: str, labels: str, inflight: int = 256,
+                      layout: Layout = Layout.per_image,
+                      compression: Compression = Compression(),
+                      chunks: Optional[int] = None,
+                      storage: Storage = Storage.pixels,
+                      append: bool = False,
+                      match: Match = Match.name) -> None:
     img_names = images(imdir)
     img_locations = tuple(os.path.join(imdir, img_name) for img_name in img_names)
-    img_data = load_images(img_locations)
     if labels is not None:
         try:
             labels_file = load_labels(labels)
@@ -108,10 +610,80 @@ def main_save_to_hdf5(imdir: str, labels: str) -> None:
             typer.echo("Labels cant be loaded only from .CSV, .TXT or .NPY files\n")
     else:
         labels_file = None
-    save_to_hdf5(imdir, img_names, img_data, labels_file)
+    path = f'{imdir}.h5'
+    append = append and os.path.exists(path)
+    if append:
+        try:
+            if labels_file is not None and len(labels_file) < len(img_names):
+                raise ValueError(f"Found {len(labels_file)} labels for {len(img_names)} images")
+            plan = plan_append(path, img_locations, labels_file, match)
+        except ValueError as error:
+            typer.echo(str(error))
+            raise typer.Exit(1)
+        layout, storage, keep, hashes = plan
+        typer.echo(f"{len(keep)} new images, {len(img_names) - len(keep)} are already in {path}")
+        if len(keep) == 0:
+            return
+        img_names = tuple(img_names[idx] for idx in keep)
+        img_locations = tuple(img_locations[idx] for idx in keep)
+        labels_file = None if labels_file is None else np.asarray(labels_file)[keep]
+    else:
+        hashes = pool_map(file_digest, img_locations, desc="Hash")
+
+    function, tasks, task_len = image_tasks(img_locations, layout, compression, chunks, storage, append)
+    img_data = stream_results(function, tasks, max(1, inflight // task_len))
+    if POOL_CONFIG.workers > 1:
+        # Workers forked while file is open would keep its lock and block later readers
+        get_pool()
+    try:
+        save_to_hdf5(imdir, img_names, img_data, labels_file, layout, compression, chunks, storage, hashes, append)
+    except ValueError as error:
+        img_data.close()
+        if not append:
+            os.remove(path)
+        typer.echo(str(error))
+        raise typer.Exit(1)
+
+
+@print_delimiter("Benchmark HDF5 codecs...")
+def main_benchmark_codecs(imdir: str, sample: int,
+                          layout: Layout = Layout.per_image,
+                          chunks: Optional[int] = None) -> None:
+    """
+    Write and read first images of imdir with each codec in one process
+    """
+
+    img_names = images(imdir)[:sample]
+    img_data = pool_map(read_image, tuple(os.path.join(imdir, img_name) for img_name in img_names))
+    megabytes = sum(img.nbytes for img in img_data) / 1024 ** 2
+    typer.echo(f"{len(img_data)} images, {megabytes:.1f} MB decoded")
+    typer.echo(f"{'codec':<10}{'write MB/s':>12}{'read MB/s':>12}{'ratio':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "codec.h5")
+        for compression in CODEC_CANDIDATES:
+            start = time.perf_counter()
+            with h5py.File(path, 'w') as hf:
+                if layout == Layout.batched:
+                    write_batched(hf, img_names, img_data, None, compression, chunks)
+                else:
+                    write_per_image(hf, img_names, img_data, None, compression)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with h5py.File(path, 'r') as hf:
+                if layout == Layout.batched:
+                    hf[IMAGES_DATASET][()]
+                else:
+                    for img_name in img_names:
+                        hf[f"data_{img_name}"][()]
+            read_time = time.perf_counter() - start
+            ratio = megabytes * 1024 ** 2 / os.path.getsize(path)
+            typer.echo(f"{str(compression):<10}{megabytes / write_time:>12.1f}"
+                       f"{megabytes / read_time:>12.1f}{ratio:>8.2f}")
 
 
 @print_delimiter("Extract images from HDF5 dataset...")
 def main_extract_from_hdf5(files: Sequence[str]):
-    for filename in files:
-        extract_from_hdf5(filename)
+    tasks = tuple(task for filename in files for task in extract_tasks(filename))
+    for _ in pool_imap(extract_slice, tasks, ordered=False, chunksize=1):
+        pass
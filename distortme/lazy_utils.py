@@ -0,0 +1,32 @@
+from typing import Any, Callable, Iterator, Mapping, Optional
+
+
+class LazyMapping(Mapping):
+    """
+    Read-only mapping created by factory on first access. Used for registries
+    of heavy objects (transforms, models), so their libraries are imported
+    only by commands which need them.
+
+    Parameters
+    ----------
+        factory: Callable[[], Mapping[str, Any]]
+            Function which imports dependencies and returns the real mapping
+    """
+
+    def __init__(self, factory: Callable[[], Mapping[str, Any]]) -> None:
+        self._factory = factory
+        self._mapping: Optional[Mapping[str, Any]] = None
+
+    def _loaded(self) -> Mapping[str, Any]:
+        if self._mapping is None:
+            self._mapping = self._factory()
+        return self._mapping
+
+    def __getitem__(self, key: str) -> Any:
+        return self._loaded()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._loaded())
+
+    def __len__(self) -> int:
+        return len(self._loaded())
@@ -1,41 +1,59 @@
+import os
 import typer
-import asyncio
 import colorama
 from typing import List
 from pathlib import Path
 from distortme.nn_models import Models
 from distortme.datasets import Datasets
-from distortme.label_utils import main_labels
-from distortme.unpack_utils import main_unpack
-from distortme.convert_utils import main_convert
+from distortme.augmentations import SlowAugs
+from distortme.hdf5_options import Codec, Layout, Match, Storage
 from distortme.main_utils import not_implemented
-from distortme.voc2coco_utils import main_voc2coco
-from distortme.coco2voc_utils import main_coco2voc
-from distortme.cusom_map_utils import main_custom_map
-from distortme.show_image_utils import main_show_image
-from distortme.rle_utils import main_torle, main_frommrle
-from distortme.datasets_download_utils import main_download
-from distortme.aug_utils import main_apply_augmentations, SlowAugs
-from distortme.split_utils import main_split_files, main_show_hist
-from distortme.hdf5_utils import main_save_to_hdf5, main_extract_from_hdf5
+from distortme.rle_options import MaskFormat, RleFormat
+from distortme.pool_utils import StartMethod, configure_pool, shutdown_pool
+from distortme.profile_utils import configure_profile
+
+# Modules with commands are imported inside of commands,
+# so each command loads only its own dependencies (torch, h5py, pandas, ...)
 
 app = typer.Typer()
 colorama.init()
 
 
 @app.callback()
-def callback() -> None:
+def callback(ctx: typer.Context,
+             workers: int = typer.Option(os.cpu_count() or 1, min=1),
+             chunksize: int = typer.Option(None, min=1),
+             start_method: StartMethod = typer.Option(StartMethod.fork),
+             profile: bool = typer.Option(False),
+             profile_out: Path = typer.Option("distortme_profile.json")) -> None:
     """
     CLI utility for augmentation and preprocessing images.
 
     Possible operations are given below under 'Commands: '
 
     To get more info type 'distortme <command> --help'
+
+    --workers      Number of worker processes shared by all commands\n
+    --chunksize    Number of tasks sent to a worker at once\n
+    --start-method Method used to start worker processes\n
+    --profile      Time decode, compute, encode, write and queue wait of each image\n
+    --profile-out  JSON file with profiling report
     """
 
+    configure_pool(workers, chunksize, start_method)
+    configure_profile(profile, str(profile_out))
+    ctx.call_on_close(shutdown_pool)
+
 
 @app.command()
-def augs(imdir: Path = None, aug: List[SlowAugs] = None) -> None:
+def augs(imdir: Path = None,
+         aug: List[SlowAugs] = None,
+         onepass: bool = typer.Option(False),
+         chain: str = typer.Option(None),
+         variants: int = typer.Option(1, min=1),
+         seed: int = typer.Option(0),
+         force: bool = typer.Option(False),
+         batch: int = typer.Option(1, min=1)) -> None:
     """
     Apply provided augmentations to all images in imdir and copy them to 
     different folders with name corresponded to augmentation.\n
@@ -43,18 +61,34 @@ def augs(imdir: Path = None, aug: List[SlowAugs] = None) -> None:
     [rotate|shift_scale_rotate|shift_hsv|equalize|resize512|resize300|resize256|resize224|to_gray|
     crop|contrast|bright]\n
 
-    --imdir Directory with images to process\n
-    --aug   Augmentation to apply. You may specify as mach augmentations as you want. 
+    --imdir    Directory with images to process\n
+    --aug      Augmentation to apply. You may specify as mach augmentations as you want.\n
+    --onepass  Decode each image once and apply all augmentations to it\n
+    --chain    Comma separated augmentations applied one after another: rotate,bright,crop\n
+    --variants Number of randomized results of --chain for each image\n
+    --seed     Base seed of --chain randomization\n
+    --force    Process all images again. Else only new or changed images are processed\n
+    --batch    Number of images decoded together. Same-sized images in batch are processed\n
+               at once by contrast, bright, to_gray, shift_hsv and equalize. Implies --onepass
     """
 
     if not imdir:
         typer.echo("Provide path to folder with images: --imdir path/to/folder")
         typer.Exit()
-    if not aug:
+    if chain:
+        try:
+            chain_augs = [SlowAugs(name.strip()) for name in chain.split(',')]
+        except ValueError:
+            typer.echo(f"Unknown augmentation in chain: {chain}")
+            raise typer.Exit(1)
+        from distortme.aug_utils import main_apply_chain
+        main_apply_chain(str(imdir), chain_augs, variants, seed, force)
+    elif not aug:
         typer.echo("Provide augmentations: --aug reisze224 --aug rotate etc.")
         typer.Exit()
     else:
-        main_apply_augmentations(str(imdir), aug)
+        from distortme.aug_utils import main_apply_augmentations
+        main_apply_augmentations(str(imdir), aug, onepass, force, batch)
 
 
 @app.command()
@@ -73,22 +107,57 @@ def split(imdir: Path = None, desc: List[str] = None, copy: bool = typer.Option(
         typer.echo("Provide descriptor of class in file name:  IMG001_cls_0.jpg -> --desc cls_0.")
         typer.Exit()
     else:
+        from distortme.split_utils import main_split_files, main_show_hist
         main_split_files(str(imdir), desc, copy)
         main_show_hist(str(imdir), desc)
 
 
 @app.command()
-def tohd5(imdir: Path = None, labels: str = typer.Option(None)) -> None:
+def tohd5(imdir: Path = None,
+          labels: str = typer.Option(None),
+          inflight: int = typer.Option(256, min=1),
+          layout: Layout = typer.Option(Layout.per_image),
+          storage: Storage = typer.Option(Storage.pixels),
+          compression: Codec = typer.Option(Codec.gzip),
+          level: int = typer.Option(4, min=0, max=9),
+          shuffle: bool = typer.Option(False),
+          chunks: int = typer.Option(None, min=1),
+          append: bool = typer.Option(False),
+          match: Match = typer.Option(Match.name),
+          benchmark_codecs: bool = typer.Option(False),
+          sample: int = typer.Option(256, min=1)) -> None:
     """
     Convert dataset into HDF5 format to speedup data loading.\n
-    --imdir Directory with images to convert
+    Images are decoded by workers while they are written, so whole dataset is never in memory.\n
+    --imdir            Directory with images to convert\n
+    --labels           File with labels of images: .csv, .txt or .npy\n
+    --inflight         Maximal number of decoded images held in memory\n
+    --layout           per-image: dataset for each image. batched: one (N, H, W, C) dataset\n
+                       'images' with 'labels' and 'names', all images must have the same shape\n
+    --storage          pixels: decoded images. encoded: bytes of image files with their shapes\n
+                       and formats, decoded only on read and extracted by 'fromhd5' as they are\n
+    --compression      Compression of decoded images: none, lzf or gzip. none and gzip are done by workers\n
+                       none without --chunks writes contiguous batched dataset which can be memory mapped\n
+    --level            Level of gzip compression from 0 to 9\n
+    --shuffle          Apply byte shuffle filter before compression\n
+    --chunks           Number of images in one chunk of batched layout. About 16KB by default\n
+    --append           Add images which are not in existing <imdir>.h5 yet, its layout and storage are kept\n
+    --match            name: skip images with names already in file. content: skip images with the same content\n
+    --benchmark-codecs Print write MB/s, read MB/s and ratio of codecs on first images instead\n
+    --sample           Number of images used by --benchmark-codecs
     """
 
     if not imdir:
         typer.echo("Provide imdir to folder with images: --imdir /path/to/images")
         typer.Exit()
+    elif benchmark_codecs:
+        from distortme.hdf5_utils import main_benchmark_codecs
+        main_benchmark_codecs(str(imdir), sample, layout, chunks)
     else:
-        main_save_to_hdf5(str(imdir), labels)
+        from distortme.hdf5_utils import main_save_to_hdf5
+        from distortme.hdf5_compression import Compression
+        main_save_to_hdf5(str(imdir), labels, inflight, layout,
+                          Compression(compression, level, shuffle), chunks, storage, append, match)
 
 
 @app.command()
@@ -102,7 +171,30 @@ def fromhd5(file: List[Path] = None) -> None:
         typer.echo("Provide at least one .h5 file")
         typer.Exit()
     else:
-        main_extract_from_hdf5(tuple(map(lambda x: str(x), file)))
+        from distortme.hdf5_utils import main_extract_from_hdf5
+        main_extract_from_hdf5(tuple(str(file_path) for file_path in file))
+
+
+@app.command()
+def toshards(imdir: Path = None,
+             out: Path = typer.Option(None),
+             shard_mb: int = typer.Option(1024, min=1),
+             recursive: bool = typer.Option(False)) -> None:
+    """
+    Pack images into tar shards of fixed size with index.json to reduce number of files.\n
+    Read them back with distortme.shards_utils.ShardReader.\n
+    --imdir     Directory with images to pack\n
+    --out       Directory for shards. <imdir>_shards by default\n
+    --shard-mb  Maximal size of one shard in megabytes\n
+    --recursive Pack images from subfolders too, e.g. results of 'augs'
+    """
+
+    if not imdir:
+        typer.echo("Provide imdir to folder with images: --imdir /path/to/images")
+        typer.Exit()
+    else:
+        from distortme.shards_utils import main_to_shards
+        main_to_shards(str(imdir), str(out) if out is not None else None, shard_mb, recursive)
 
 
 @app.command()
@@ -118,41 +210,55 @@ def download(dataset: List[Datasets] = None, to: Path = typer.Option(None)) -> N
         typer.echo("Provide name of dataset like --dataset MNIST to download PACKED (archived) data")
         typer.Exit()
     else:
+        import asyncio
+        from distortme.datasets_download_utils import main_download
         asyncio.run(main_download(dataset, str(to)))
 
 
 @app.command()
-def torle(imdir: Path = typer.Option(None)) -> None:
+def torle(imdir: Path = typer.Option(None),
+          multiclass: bool = typer.Option(False),
+          out_format: RleFormat = typer.Option(RleFormat.csv, "--format")) -> None:
     """
     Convert images with masks to .csv filr with RLE labels.\n
-    --imdir Directory with images to convert.\n
+    --imdir      Directory with images to convert.\n
+    --multiclass Masks are label maps: write row with RLE of each class of each image\n
+    --format     csv with rle strings or npz with int32 runs, read by fromrle without parsing\n
     """
 
     if not imdir:
         typer.echo("Provide imdir to folder with images: --imdir /path/to/images")
         typer.Exit()
     else:
-        main_torle(str(imdir))
+        from distortme.rle_utils import main_torle
+        main_torle(str(imdir), multiclass, out_format)
 
 
 @app.command()
 def fromrle(file: Path = None,
             colrle: str = typer.Option("rle"),
             colsize: str = typer.Option("size"),
-            colimg: str = typer.Option("image_name")) -> None:
+            colimg: str = typer.Option("image_name"),
+            colclass: str = typer.Option(None),
+            out_format: MaskFormat = typer.Option(MaskFormat.png, "--format"),
+            compression: int = typer.Option(None, min=0, max=9)) -> None:
     """
     Convert RLE format of masks to .PNG. \n
-    --file    File with RLE labels\n
-    --colrle  Column in dataframe with rles\n
-    --colsize Column in dataframe with size for each mask\n
-    --colimg  Column in dataframe with name of corresponding image\n
+    --file     File with RLE labels: .csv or .npz created by 'torle --format npz'\n
+    --colrle   Column in dataframe with rles\n
+    --colsize  Column in dataframe with size for each mask\n
+    --colimg   Column in dataframe with name of corresponding image\n
+    --colclass Column with class of each rle: rles of image are merged into label map\n
+    --format   png image of each mask or one npz file with all masks\n
+    --compression PNG compression level or deflate level of npz, 0-9\n
     """
 
     if not file:
         typer.echo("Provide path to .csv file with encoded masks")
         typer.Exit()
     else:
-        main_frommrle(str(file), colrle, colsize, colimg)
+        from distortme.rle_utils import main_frommrle
+        main_frommrle(str(file), colrle, colsize, colimg, colclass, out_format, compression)
 
 
 @app.command()
@@ -166,19 +272,24 @@ def unpack(file: List[Path] = None) -> None:
         typer.echo("Provide file to unpack:  --file /path/to/archive")
         typer.Exit()
     else:
+        from distortme.unpack_utils import main_unpack
         main_unpack(tuple(str(file_path) for file_path in file))
 
 
 @app.command()
 def convert(imdir: Path = None,
             orig: List[str] = typer.Option(None),
-            to: str = None) -> None:
+            to: str = None,
+            width: int = typer.Option(None, min=1),
+            height: int = typer.Option(None, min=1)) -> None:
     """
     Convert images to certain extension as .jpg .png etc.\n
 
-    --imdir Directory with images to process\n
-    --orig  Formats of files that will be concerted\n
-    --to    Target format\n
+    --imdir  Directory with images to process\n
+    --orig   Formats of files that will be concerted\n
+    --to     Target format\n
+    --width  Width of resized images. Used together with --height\n
+    --height Height of resized images. Used together with --width\n
     """
     if not imdir:
         typer.echo("Provide imdir to folder with images: --imdir /path/to/images")
@@ -187,7 +298,9 @@ def convert(imdir: Path = None,
         typer.echo("Provide target format of images: img.orig -> img.to")
         typer.Exit()
     else:
-        main_convert(str(imdir), orig, to)
+        from distortme.convert_utils import main_convert
+        main_convert(str(imdir), orig, to,
+                     (height, width) if width and height else None)
 
 
 @app.command()
@@ -214,6 +327,7 @@ def label(imdir: Path = None,
         typer.echo("Provide imdir to folder with images: --imdir /path/to/images")
         typer.Exit()
     else:
+        from distortme.label_utils import main_labels
         main_labels(str(imdir), task, bs, str(out))
 
 
@@ -253,6 +367,7 @@ def voc2coco(anndir: Path = None,
         typer.echo("Provide path to file with labels like /path/to/labels.txt")
         typer.Exit()
     else:
+        from distortme.voc2coco_utils import main_voc2coco
         main_voc2coco(str(anndir),
                       str(annids),
                       str(labels),
@@ -272,17 +387,27 @@ def coco2voc(anns: Path = None, dstdir = typer.Option(None)) -> None:
         typer.echo("Provide path to COCO annotation .json file")
         typer.Exit()
     else:
+        from distortme.coco2voc_utils import main_coco2voc
         main_coco2voc(str(anns), 
                       str(dstdir) if dstdir is not None else None)
 
 
 @app.command()
-def map(imdir: Path = None, fun: Path = None, resdir: Path = None) -> None:
+def map(imdir: Path = None,
+        fun: Path = None,
+        resdir: Path = None,
+        width: int = typer.Option(None, min=1),
+        height: int = typer.Option(None, min=1),
+        batch: int = typer.Option(1, min=1)) -> None:
     """
     Apply csutom processing to all files in folder\n
     --imdir  Path to folder with files to process\n
-    --fun    Path to script.py file with function 'process' with only one argument\n
+    --fun    Path to script.py file with function 'map_fn' of one image and/or 'map_batch_fn' of batch\n
     --resdir Path to dir with modified images\n
+    --width  Width images are resized to before processing. Used together with --height\n
+    --height Height images are resized to before processing. Used together with --width\n
+    --batch  Number of images decoded together. Same-sized images in batch are passed\n
+             to 'map_batch_fn' of script at once as (N, H, W, C) array\n
     """
 
     if not imdir:
@@ -294,7 +419,9 @@ def map(imdir: Path = None, fun: Path = None, resdir: Path = None) -> None:
     if not resdir:
         typer.echo("Provide path to result directory")
     else:
-        main_custom_map(str(imdir), str(fun), str(resdir))
+        from distortme.cusom_map_utils import main_custom_map
+        main_custom_map(str(imdir), str(fun), str(resdir),
+                        (height, width) if width and height else None, batch)
 
 
 @app.command()
@@ -310,4 +437,5 @@ def show(impath: Path = None, height: int = typer.Option(35)) -> None:
         typer.echo("Provide path to image to show")
         typer.Exit()
     else:
+        from distortme.show_image_utils import main_show_image
         main_show_image(str(impath), height)
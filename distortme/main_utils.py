@@ -2,6 +2,8 @@ import typer
 from typing import Callable, List, Any, Dict
 from functools import wraps
 
+from distortme.profile_utils import profile_session
+
 
 def print_delimiter(op_name: str, up_symbol: str = '=', down_symbol: str = '=') -> Callable:
     def delimiter(f: Callable) -> Callable:
@@ -11,7 +13,8 @@ def print_delimiter(op_name: str, up_symbol: str = '=', down_symbol: str = '=')
                 typer.echo(f"[ {op_name} ]".center(80, up_symbol))
             else:
                 typer.echo(op_name.center(80))
-            f(*args, **kwargs)
+            with profile_session(op_name):
+                f(*args, **kwargs)
             if down_symbol is not None:
                 typer.echo("[ DONE ]".center(80, down_symbol))
             else:
@@ -45,3 +48,8 @@ def not_implemented(f: Callable) -> Callable:
         typer.secho("This functionality is not fully implemented yet. Updates soon.".center(80), fg=typer.colors.RED)
         f(*args, **kwargs)
     return wrapper
+
+
+def print_throughput(num_images: int, elapsed: float) -> None:
+    speed = num_images / elapsed if elapsed > 0 else float("inf")
+    typer.echo(f"Processed {num_images} images in {elapsed:.2f}s [{speed:.1f} images/s]")
@@ -0,0 +1,80 @@
+import os
+import json
+from typing import Dict, Sequence, Tuple
+
+from distortme.files_utils import atomic_write
+
+
+MANIFEST_NAME = ".distortme_manifest.json"
+FLUSH_EVERY = 1000
+
+Stamp = Tuple[int, int]
+
+
+def source_stamp(path: str) -> Stamp:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Manifest:
+    """
+    Record of source images already processed into output folder.
+
+    Each source path is stored with its size and mtime. All entries are
+    dropped if output folder was produced with different config,
+    e.g. other parameters of augmentation.
+
+    Parameters
+    ----------
+        folder: str
+            Output folder where manifest is stored
+
+        config: str
+            Description of processing applied to sources
+
+        force: bool
+            Ignore existing manifest and process all sources again
+    """
+
+    def __init__(self, folder: str, config: str, force: bool = False) -> None:
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.config = config
+        self.entries: Dict[str, Stamp] = {} if force else self._load()
+        self._pending: Dict[str, Stamp] = {}
+        self._unsaved = 0
+
+    def _load(self) -> Dict[str, Stamp]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("config") != self.config:
+            return {}
+        return {path: tuple(entry) for path, entry in manifest.get("files", {}).items()}
+
+    def stale(self, sources: Sequence[str]) -> Tuple[str, ...]:
+        """
+        Sources which are new or changed since they were processed last time
+        """
+
+        result = []
+        for src in sources:
+            stamp = source_stamp(src)
+            if self.entries.get(os.path.abspath(src)) != stamp:
+                self._pending[src] = stamp
+                result.append(src)
+        return tuple(result)
+
+    def done(self, src: str) -> None:
+        self.entries[os.path.abspath(src)] = self._pending.pop(src)
+        self._unsaved += 1
+        if self._unsaved >= FLUSH_EVERY:
+            self.save()
+
+    def save(self) -> None:
+        data = json.dumps({"config": self.config, "files": self.entries})
+        atomic_write(self.path, data.encode())
+        self._unsaved = 0
@@ -1,6 +1,7 @@
 from enum import Enum
+from typing import Mapping
 from frozendict import frozendict
-from distortme.nn_algorithms.faces.wrappers.blaze_face_wrapper import BlazeFaceWrapper
+from distortme.lazy_utils import LazyMapping
 
 
 class Models(str, Enum):
@@ -10,7 +11,13 @@ class Models(str, Enum):
     masks = "masks"
 
 
-TASK_TO_MODEL = frozendict(
-    faces=BlazeFaceWrapper
-)
+def create_task_to_model() -> Mapping[str, type]:
+    from distortme.nn_algorithms.faces.wrappers.blaze_face_wrapper import BlazeFaceWrapper
+    return frozendict(
+        faces=BlazeFaceWrapper
+    )
+
+
+# torch is imported only when model is requested
+TASK_TO_MODEL = LazyMapping(create_task_to_model)
 
@@ -0,0 +1,193 @@
+import os
+import atexit
+import threading
+from enum import Enum
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from distortme.profile_utils import PROFILE_CONFIG, Profiled, submit, receive
+
+if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+
+
+class StartMethod(str, Enum):
+    fork = "fork"
+    spawn = "spawn"
+    forkserver = "forkserver"
+
+
+@dataclass
+class PoolConfig:
+    """
+    Settings of the worker pool shared by all commands
+
+    Parameters
+    ----------
+        workers: int
+            Number of worker processes. With one worker tasks run in the main process
+
+        chunksize: Optional[int]
+            Number of tasks sent to a worker at once. Estimated from data size if None
+
+        start_method: StartMethod
+            Method used to start worker processes
+    """
+
+    workers: int = os.cpu_count() or 1
+    chunksize: Optional[int] = None
+    start_method: StartMethod = StartMethod.fork
+
+
+POOL_CONFIG = PoolConfig()
+_POOL: Optional["Pool"] = None
+
+
+def configure_pool(workers: Optional[int] = None,
+                   chunksize: Optional[int] = None,
+                   start_method: Optional[StartMethod] = None) -> None:
+    shutdown_pool()
+    if workers is not None:
+        POOL_CONFIG.workers = max(1, workers)
+    POOL_CONFIG.chunksize = chunksize
+    if start_method is not None:
+        POOL_CONFIG.start_method = StartMethod(start_method)
+
+
+def get_pool() -> "Pool":
+    global _POOL
+    if _POOL is None:
+        import multiprocessing as mp
+        context = mp.get_context(POOL_CONFIG.start_method.value)
+        _POOL = context.Pool(POOL_CONFIG.workers)
+    return _POOL
+
+
+def shutdown_pool(terminate: bool = False) -> None:
+    global _POOL
+    if _POOL is None:
+        return
+    if terminate:
+        _POOL.terminate()
+    else:
+        _POOL.close()
+    _POOL.join()
+    _POOL = None
+
+
+atexit.register(shutdown_pool)
+
+
+def get_chunksize(total: Optional[int]) -> int:
+    if POOL_CONFIG.chunksize is not None:
+        return max(1, POOL_CONFIG.chunksize)
+    if not total:
+        return 1
+    chunksize, extra = divmod(total, POOL_CONFIG.workers * 4)
+    return chunksize + 1 if extra else max(1, chunksize)
+
+
+def pool_imap(function: Callable[[Any], Any],
+              data: Iterable[Any],
+              total: Optional[int] = None,
+              ordered: bool = True,
+              desc: Optional[str] = None,
+              chunksize: Optional[int] = None) -> Iterator[Any]:
+    """
+    Lazily apply function to every element of data with the shared pool
+
+    Parameters
+    ----------
+        function: Callable[[Any], Any]
+            Picklable function applied to each element
+
+        data: Iterable[Any]
+            Elements to process
+
+        total: Optional[int]
+            Number of elements, used for progress bar and chunk size
+
+        ordered: bool
+            Yield results in order of data if enabled. Else as soon as they are ready
+
+        desc: Optional[str]
+            Description of progress bar
+
+        chunksize: Optional[int]
+            Number of tasks sent to a worker at once. Overrides estimated and configured value
+
+    Return
+    ------
+        results: Iterator[Any]
+            Results of function for each element
+    """
+
+    from tqdm import tqdm
+
+    if total is None and hasattr(data, "__len__"):
+        total = len(data)
+    if POOL_CONFIG.workers == 1:
+        yield from tqdm(map(function, data), total=total, desc=desc, ncols=80)
+        return
+
+    pool = get_pool()
+    imap = pool.imap if ordered else pool.imap_unordered
+    chunksize = chunksize or get_chunksize(total)
+    completed = False
+    try:
+        if PROFILE_CONFIG.enabled:
+            results = map(receive, imap(Profiled(function), submit(data), chunksize))
+        else:
+            results = imap(function, data, chunksize)
+        yield from tqdm(results, total=total, desc=desc, ncols=80)
+        completed = True
+    finally:
+        if not completed:
+            shutdown_pool(terminate=True)
+
+
+def pool_map(function: Callable[[Any], Any],
+             data: Iterable[Any],
+             desc: Optional[str] = None) -> Tuple[Any, ...]:
+    return tuple(pool_imap(function, data, desc=desc))
+
+
+class InFlightLimit:
+    """
+    Iterable over data which blocks when limit elements are taken and not released yet.
+    Pool takes tasks from it in a separate thread, so consumer bounds number of
+    tasks queued or processed in workers and results waiting to be consumed
+    by releasing each result after it is handled.
+
+    Parameters
+    ----------
+        data: Iterable[Any]
+            Elements to process
+
+        limit: int
+            Maximal number of elements in flight. Must not be less than chunksize
+    """
+
+    def __init__(self, data: Iterable[Any], limit: int) -> None:
+        self.data = data
+        self.limit = max(1, limit)
+        self.closed = False
+        self._semaphore = threading.Semaphore(self.limit)
+
+    def __iter__(self) -> Iterator[Any]:
+        for element in self.data:
+            self._semaphore.acquire()
+            if self.closed:
+                return
+            yield element
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    def close(self) -> None:
+        """
+        Stop producing elements and wake up blocked producer
+        """
+
+        self.closed = True
+        self._semaphore.release()
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import typer
+from array import array
+from functools import wraps
+from dataclasses import dataclass
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Stages in order they happen to one image
+STAGES = ("queue_wait", "decode", "compute", "encode", "write", "result_wait")
+PERCENTILES = (50, 90, 99)
+
+Samples = Dict[str, array]
+
+
+@dataclass
+class ProfileConfig:
+    """
+    Settings of per-stage profiling
+
+    Parameters
+    ----------
+        enabled: bool
+            Collect timings of stages if enabled
+
+        output: str
+            Path to JSON report written after each command
+    """
+
+    enabled: bool = False
+    output: str = "distortme_profile.json"
+
+
+PROFILE_CONFIG = ProfileConfig()
+
+# Timings recorded in current process and not yet collected by parent
+_SAMPLES: Samples = defaultdict(lambda: array('d'))
+# Timings of all processes collected by parent: pid -> stage -> durations
+_COLLECTED: Dict[int, Samples] = defaultdict(lambda: defaultdict(lambda: array('d')))
+
+
+def configure_profile(enabled: bool, output: str = None) -> None:
+    PROFILE_CONFIG.enabled = enabled
+    if output is not None:
+        PROFILE_CONFIG.output = output
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Record duration of code block as one sample of stage if profiling is enabled
+    """
+
+    if not PROFILE_CONFIG.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _SAMPLES[name].append(time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def drain_samples() -> Dict[str, array]:
+    samples = dict(_SAMPLES)
+    _SAMPLES.clear()
+    return samples
+
+
+def collect_samples(pid: int, samples: Dict[str, array]) -> None:
+    for name, durations in samples.items():
+        _COLLECTED[pid][name].extend(durations)
+
+
+class Profiled:
+    """
+    Wrapper of function executed in worker process. Task is a pair of
+    submission time and argument, result is returned with timings of worker.
+    """
+
+    def __init__(self, function: Callable[[Any], Any]) -> None:
+        self.function = function
+
+    def __call__(self, task: Tuple[float, Any]) -> Tuple[Any, int, float, Samples]:
+        submitted, arg = task
+        PROFILE_CONFIG.enabled = True
+        _SAMPLES["queue_wait"].append(max(0.0, time.time() - submitted))
+        result = self.function(arg)
+        return result, os.getpid(), time.time(), drain_samples()
+
+
+def submit(data: Iterator[Any]) -> Iterator[Tuple[float, Any]]:
+    return ((time.time(), arg) for arg in data)
+
+
+def receive(task_result: Tuple[Any, int, float, Samples]) -> Any:
+    result, pid, finished, samples = task_result
+    samples.setdefault("result_wait", array('d')).append(max(0.0, time.time() - finished))
+    collect_samples(pid, samples)
+    return result
+
+
+def stage_stats(durations: "np.ndarray") -> Dict[str, float]:
+    import numpy as np
+    stats = {"count": int(durations.size),
+             "total_s": float(durations.sum()),
+             "mean_ms": float(durations.mean() * 1000)}
+    for percentile, value in zip(PERCENTILES, np.percentile(durations, PERCENTILES)):
+        stats[f"p{percentile}_ms"] = float(value * 1000)
+    return stats
+
+
+def build_report(op_name: str, wall_time: float) -> Dict[str, Any]:
+    import numpy as np
+    collect_samples(os.getpid(), drain_samples())
+    by_stage: Dict[str, list] = defaultdict(list)
+    workers = {}
+    for pid, samples in _COLLECTED.items():
+        workers[str(pid)] = {name: float(sum(durations)) for name, durations in samples.items()}
+        for name, durations in samples.items():
+            by_stage[name].append(np.frombuffer(durations, dtype=np.float64))
+    order = [name for name in STAGES if name in by_stage] + sorted(set(by_stage) - set(STAGES))
+    stages = {name: stage_stats(np.concatenate(by_stage[name])) for name in order}
+    counted_stage = next((name for name in ("decode", "compute") if name in stages), None)
+    images = stages[counted_stage]["count"] if counted_stage else 0
+    return {"operation": op_name,
+            "wall_time_s": wall_time,
+            "images": images,
+            "images_per_s": images / wall_time if wall_time > 0 else 0.0,
+            "stages": stages,
+            "workers": workers}
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    typer.echo(f"{'stage':<12}{'count':>9}{'total s':>10}{'mean ms':>10}"
+               + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for name, stats in report["stages"].items():
+        typer.echo(f"{name:<12}{stats['count']:>9}{stats['total_s']:>10.2f}{stats['mean_ms']:>10.2f}"
+                   + "".join(f"{stats[f'p{p}_ms']:>10.2f}" for p in PERCENTILES))
+    typer.echo(f"{report['images']} images in {report['wall_time_s']:.2f}s "
+               f"[{report['images_per_s']:.1f} images/s] with {len(report['workers'])} processes")
+
+
+@contextmanager
+def profile_session(op_name: str) -> Iterator[None]:
+    """
+    Collect timings of all stages during operation, then save JSON report and print summary
+    """
+
+    if not PROFILE_CONFIG.enabled:
+        yield
+        return
+    drain_samples()
+    _COLLECTED.clear()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report = build_report(op_name, time.perf_counter() - start)
+        with open(PROFILE_CONFIG.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print_report(report)
+        typer.echo(f"Profile saved to {PROFILE_CONFIG.output}")
@@ -0,0 +1,30 @@
+from enum import Enum
+
+
+class RleFormat(str, Enum):
+    """
+    csv: rles as "start length ..." strings with image_name and size columns
+    npz: runs as one int32 array with offsets of each rle, names, heights and widths as columns
+    """
+
+    csv = "csv"
+    npz = "npz"
+
+
+class MaskFormat(str, Enum):
+    """
+    png: one image for each mask or label map
+    npz: one file with array of each mask named after image
+    """
+
+    png = "png"
+    npz = "npz"
+
+
+# Arrays of npz file with rles
+NAMES_ARRAY = "names"
+CLASSES_ARRAY = "classes"
+HEIGHTS_ARRAY = "heights"
+WIDTHS_ARRAY = "widths"
+RUNS_ARRAY = "runs"
+OFFSETS_ARRAY = "offsets"
@@ -1,80 +1,646 @@
 import os
-from typing import Any, Sequence, Tuple, Callable
+import re
+import csv
+import zipfile
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
+import typer
 import pandas as pd
-from tqdm import tqdm
-import multiprocessing as mp
-from tqdm.contrib.concurrent import process_map
 
 from distortme.base_types import Image
 from distortme.files_utils import images
 from distortme.main_utils import print_delimiter
+from distortme.pool_utils import pool_imap
+from distortme.profile_utils import stage, timed
+from distortme.rle_options import (CLASSES_ARRAY, HEIGHTS_ARRAY, NAMES_ARRAY, OFFSETS_ARRAY, RUNS_ARRAY,
+                                   WIDTHS_ARRAY, MaskFormat, RleFormat)
 
 
-def rle2mask(mask_and_shape: Tuple[str, Image]) -> Image:
+# Masks with less runs per pixel are decoded run by run
+SPARSE_RUNS_PER_PIXEL = 1 / 1024
+# Shape of mask as (height, width) or its string from csv, e.g. "(768, 768)"
+Shape = Union[Tuple[int, int], str]
+# COCO rle: {"size": [height, width], "counts": compressed string or list of run lengths}
+CocoRle = Dict[str, Any]
+
+
+def parse_shape(shape: Shape) -> Tuple[int, int]:
+    if isinstance(shape, str):
+        height, width = (int(x) for x in re.findall(r"\d+", shape)[:2])
+        return height, width
+    return int(shape[0]), int(shape[1])
+
+
+def rle_runs(mask_rle: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zero-based starts and ends of runs of rle string "start length start length ...".
+    Missing rle (NaN or empty string) has no runs
+    """
+
+    if not isinstance(mask_rle, str) or not mask_rle.strip():
+        return split_runs(np.empty(0, dtype=np.int64))
+    return split_runs(np.fromstring(mask_rle, dtype=np.int64, sep=' '))
+
+
+def split_runs(runs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zero-based starts and ends of flat array of one-based pairs "start length"
+    """
+
+    starts = runs[0::2].astype(np.int64) - 1
+    return starts, starts + runs[1::2]
+
+
+def decode_runs(starts: np.ndarray, ends: np.ndarray, size: int) -> np.ndarray:
+    """
+    Flat uint8 mask of size pixels with ones inside runs. Boundaries of runs are toggled
+    and mask is accumulated with xor, so there is no loop over runs. Sparse masks
+    are filled run by run, since it is cheaper than touching every pixel
+    """
+
+    if len(starts) < size * SPARSE_RUNS_PER_PIXEL:
+        mask = np.zeros(size, dtype=np.uint8)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            mask[start:end] = 1
+        return mask
+    marks = np.zeros(size + 1, dtype=bool)
+    marks[starts] ^= True
+    marks[ends] ^= True
+    return np.logical_xor.accumulate(marks[:-1]).view(np.uint8)
+
+
+@timed("compute")
+def rle2mask(mask_and_shape: Tuple[str, Shape]) -> Image:
+    """
+    Decode rle of column-major (height, width) mask created by mask2rle
+    """
+
     mask_rle, shape = mask_and_shape
-    if mask_rle != mask_rle:
-        return np.zeros_like(shape)
+    height, width = parse_shape(shape)
+    starts, ends = rle_runs(mask_rle)
+    return decode_runs(starts, ends, height * width).reshape(width, height).T
 
-    s = mask_rle.split()
-    starts, lengths = [np.asarray(x, dtype=int)
-                       for x in (s[0:][::2], s[1:][::2])]
-    starts -= 1
-    ends = starts + lengths
-    img = np.zeros(shape[0]*shape[1], dtype=np.uint8)
-    for lo, hi in zip(starts, ends):
-        img[lo:hi] = 1
-    return img.reshape(shape).T
 
+@timed("compute")
+def runs2mask(runs_and_shape: Tuple[np.ndarray, Shape]) -> Image:
+    """
+    Decode flat "start length" runs of npz file created by 'torle --format npz'
+    """
+
+    runs, shape = runs_and_shape
+    height, width = parse_shape(shape)
+    starts, ends = split_runs(runs)
+    return decode_runs(starts, ends, height * width).reshape(width, height).T
+
+
+@timed("compute")
+def rle2masks(mask_rles: Sequence[str], shape: Shape) -> np.ndarray:
+    """
+    Decode rles of masks with the same shape into one (N, height, width) array with one cumulative sum
+    """
+
+    height, width = parse_shape(shape)
+    size = height * width
+    runs = tuple(rle_runs(mask_rle) for mask_rle in mask_rles)
+    offsets = np.repeat(np.arange(len(runs), dtype=np.int64) * size, [len(starts) for starts, _ in runs])
+    starts = np.concatenate([starts for starts, _ in runs] + [np.empty(0, dtype=np.int64)]) + offsets
+    ends = np.concatenate([ends for _, ends in runs] + [np.empty(0, dtype=np.int64)]) + offsets
+    return decode_runs(starts, ends, len(runs) * size).reshape(len(runs), width, height).transpose(0, 2, 1)
+
+
+def mask_runs(image: Image) -> np.ndarray:
+    """
+    Flat one-based pairs "start length" of column-major mask
+    """
 
-def mask2rle(image: Image) -> str:
     image = image.T > 0.5
     pixels = image.flatten()
     pixels = np.concatenate([[0], pixels, [0]])
     runs = np.where(pixels[1:] != pixels[:-1])[0] + 1
     runs[1::2] -= runs[::2]
-    return ' '.join(str(x) for x in runs)
+    return runs
 
 
-def save_mask(image_data: Tuple[str, Image]) -> None:
-    cv2.imwrite(image_data[0], image_data[1])
+@timed("compute")
+def mask2rle(image: Image) -> str:
+    return ' '.join(str(x) for x in mask_runs(image))
 
 
-def proces_async(data: Sequence[Any],
-                 function: Callable[[Tuple[Any, ...]], Any]) -> Tuple[Any, ...]:
-    if len(data) < 100:
-        res = []
-        for data_sample in tqdm(data, ncols=80):
-            res.append(function(data_sample))
-        return tuple(res)
-    else:
-        return tuple(process_map(function, data,
-                                 max_workers=mp.cpu_count(), ncols=80))
+@timed("compute")
+def mask2runs(image: Image) -> np.ndarray:
+    return mask_runs(image).astype(np.int32)
+
+
+def flat_runs(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    runs = np.empty(2 * len(starts), dtype=np.int64)
+    runs[0::2] = starts + 1
+    runs[1::2] = ends - starts
+    return runs
+
+
+def runs2rle(starts: np.ndarray, ends: np.ndarray) -> str:
+    return ' '.join(map(str, flat_runs(starts, ends).tolist()))
+
+
+def label_runs(image: Image) -> Tuple[Tuple[int, np.ndarray, np.ndarray], ...]:
+    """
+    Zero-based starts and ends of runs of each class of label map except background 0.
+    Runs of equal values are found in one pass over pixels and sorted by class,
+    instead of thresholding image for each class
+
+    Parameters
+    ----------
+        image: Image
+            (height, width) label map
+
+    Return
+    ------
+        runs: Tuple[Tuple[int, np.ndarray, np.ndarray], ...]
+            Class, starts and ends of runs of its column-major mask, sorted by class
+    """
+
+    pixels = image.T.ravel()
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    starts = np.concatenate(([0], changes))
+    ends = np.concatenate((changes, [len(pixels)]))
+    values = pixels[starts]
+    foreground = values != 0
+    starts, ends, values = starts[foreground], ends[foreground], values[foreground]
+    # Stable sort keeps runs of each class ordered by start
+    order = np.argsort(values, kind='stable')
+    starts, ends, values = starts[order], ends[order], values[order]
+    classes, first = np.unique(values, return_index=True)
+    bounds = np.append(first, len(values))
+    return tuple((int(label), starts[lo:hi], ends[lo:hi])
+                 for label, lo, hi in zip(classes, bounds[:-1], bounds[1:]))
+
+
+@timed("compute")
+def mask2rles(image: Image) -> Tuple[Tuple[int, str], ...]:
+    """
+    Pairs of class and rle of each class of label map, sorted by class
+    """
+
+    return tuple((label, runs2rle(starts, ends)) for label, starts, ends in label_runs(image))
+
+
+@timed("compute")
+def label_map2runs(image: Image) -> Tuple[Tuple[int, np.ndarray], ...]:
+    return tuple((label, flat_runs(starts, ends).astype(np.int32)) for label, starts, ends in label_runs(image))
+
+
+class MaskTask(NamedTuple):
+    """
+    Rles of one image decoded by one worker. Binary mask has one rle with class None,
+    rles of classes are merged into one label map. Rle is a string or array of runs
+    """
+
+    name: str
+    out_dir: str
+    shape: Shape
+    rles: Tuple[Tuple[Optional[int], Any], ...]
+    compression: Optional[int] = None
+
+
+def mask_tasks(img_names: Sequence[str],
+               classes: Optional[Sequence[int]],
+               rles_and_shapes: Sequence[Tuple[Any, Shape]],
+               compression: Optional[int] = None) -> Tuple[MaskTask, ...]:
+    """
+    Task for each rle or, with classes, for each image with rles of all its classes
+    """
+
+    out_dir = os.path.abspath(os.getcwd())
+    if classes is None:
+        return tuple(MaskTask(img_name, out_dir, shape, ((None, rle), ), compression)
+                     for img_name, (rle, shape) in zip(img_names, rles_and_shapes))
+    grouped = {}
+    for img_name, label, (rle, shape) in zip(img_names, classes, rles_and_shapes):
+        grouped.setdefault(img_name, (shape, []))[1].append((label, rle))
+    return tuple(MaskTask(img_name, out_dir, shape, tuple(rles), compression)
+                 for img_name, (shape, rles) in grouped.items())
+
+
+def decode_task(task: MaskTask) -> Image:
+    mask = None
+    for label, rle in task.rles:
+        decoded = runs2mask((rle, task.shape)) if isinstance(rle, np.ndarray) else rle2mask((rle, task.shape))
+        if label is None:
+            return decoded
+        if mask is None:
+            mask = np.zeros(decoded.shape, dtype=np.uint8)
+        mask[decoded > 0] = label
+    return mask
+
+
+def runs2counts(starts: np.ndarray, ends: np.ndarray, size: int) -> np.ndarray:
+    """
+    COCO counts: lengths of alternating runs of zeros and ones starting with zeros
+    """
+
+    counts = np.empty(2 * len(starts) + 1, dtype=np.int64)
+    counts[0:-1:2] = starts - np.concatenate(([0], ends[:-1]))
+    counts[1::2] = ends - starts
+    counts[-1] = size - (ends[-1] if len(ends) else 0)
+    return counts if counts[-1] or len(counts) == 1 else counts[:-1]
+
+
+def counts2runs(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    bounds = np.cumsum(counts)
+    runs = len(counts) // 2
+    return bounds[0:2 * runs:2], bounds[1:2 * runs:2]
+
+
+def counts2string(counts: np.ndarray) -> str:
+    """
+    Compressed COCO counts as in pycocotools: differences with counts two steps back
+    written as 5-bit groups with continuation bit, each shifted into printable character.
+    Groups of all counts are produced together, one step per 5 bits
+    """
+
+    values = np.array(counts, dtype=np.int64)
+    values[3:] -= np.asarray(counts, dtype=np.int64)[1:-2]
+    chars, written = [], []
+    more = np.ones(len(values), dtype=bool)
+    while more.any():
+        char = values & 0x1f
+        values >>= 5
+        follows = more & np.where(char & 0x10, values != -1, values != 0)
+        chars.append(np.where(follows, char | 0x20, char) + 48)
+        written.append(more)
+        more = follows
+    return np.stack(chars, axis=1)[np.stack(written, axis=1)].astype(np.uint8).tobytes().decode()
+
+
+def string2counts(string: str) -> np.ndarray:
+    codes = np.frombuffer(string.encode(), dtype=np.uint8).astype(np.int64) - 48
+    if len(codes) == 0:
+        return codes
+    last = (codes & 0x20) == 0
+    ends = np.flatnonzero(last)
+    firsts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 5 * (np.arange(len(codes)) - np.repeat(firsts, ends - firsts + 1))
+    values = np.add.reduceat((codes & 0x1f) << shifts, firsts)
+    # Sign of number is in 0x10 bit of its last group
+    negative = (codes[ends] & 0x10) != 0
+    values[negative] -= np.left_shift(1, shifts[ends][negative] + 5)
+    # Counts after third are differences with counts two steps back
+    values[3::2] = np.cumsum(np.concatenate((values[1:2], values[3::2])))[1:]
+    values[4::2] = np.cumsum(np.concatenate((values[2:3], values[4::2])))[1:]
+    return values
+
+
+def coco_runs(rle: CocoRle) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Zero-based starts and ends of runs of compressed or uncompressed COCO rle
+    """
+
+    counts = rle["counts"]
+    if isinstance(counts, bytes):
+        counts = counts.decode()
+    return counts2runs(string2counts(counts) if isinstance(counts, str) else np.asarray(counts, dtype=np.int64))
+
+
+def coco_rle(starts: np.ndarray, ends: np.ndarray, shape: Shape) -> CocoRle:
+    height, width = parse_shape(shape)
+    return {"size": [height, width], "counts": counts2string(runs2counts(starts, ends, height * width))}
+
+
+@timed("compute")
+def mask2coco(image: Image) -> CocoRle:
+    """
+    Compressed COCO rle of binary (height, width) mask
+    """
+
+    pixels = np.concatenate(([False], image.T.ravel() > 0, [False]))
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1])
+    return coco_rle(changes[0::2], changes[1::2], image.shape[:2])
+
+
+@timed("compute")
+def coco2mask(rle: CocoRle) -> Image:
+    height, width = rle["size"]
+    starts, ends = coco_runs(rle)
+    return decode_runs(starts, ends, height * width).reshape(width, height).T
+
+
+def rle2coco(mask_rle: str, shape: Shape) -> CocoRle:
+    """
+    Convert rle string "start length ..." to compressed COCO rle
+    """
+
+    return coco_rle(*rle_runs(mask_rle), shape)
+
+
+def coco2rle(rle: CocoRle) -> str:
+    return runs2rle(*coco_runs(rle))
+
+
+def coco_area(rle: CocoRle) -> int:
+    starts, ends = coco_runs(rle)
+    return int(np.sum(ends - starts))
+
+
+def coco_bbox(rle: CocoRle) -> Tuple[int, int, int, int]:
+    """
+    Bounding box [x, y, width, height] from runs: run which crosses column covers whole height
+    """
+
+    height, _ = rle["size"]
+    starts, ends = coco_runs(rle)
+    starts, ends = starts[ends > starts], ends[ends > starts] - 1
+    if len(starts) == 0:
+        return 0, 0, 0, 0
+    x_start, x_end = starts // height, ends // height
+    crossing = x_start != x_end
+    y_start = np.where(crossing, 0, starts % height)
+    y_end = np.where(crossing, height - 1, ends % height)
+    x, y = int(x_start.min()), int(y_start.min())
+    return x, y, int(x_end.max()) - x + 1, int(y_end.max()) - y + 1
+
+
+def merge_runs(runs: Sequence[Tuple[np.ndarray, np.ndarray]],
+               intersect: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Union or intersection of runs of several masks. Starts and ends of all runs are
+    sorted and masks covering each interval between them are counted
+    """
+
+    positions = np.concatenate([run for starts, ends in runs for run in (starts, ends)] + [np.empty(0, np.int64)])
+    deltas = np.concatenate([np.full(len(run), sign, dtype=np.int64)
+                             for starts, ends in runs for run, sign in ((starts, 1), (ends, -1))] + [np.empty(0, np.int64)])
+    order = np.argsort(positions, kind='stable')
+    positions, coverage = positions[order], np.cumsum(deltas[order])
+    # Coverage after all events at the same position
+    unique, first = np.unique(positions, return_index=True)
+    coverage = coverage[np.append(first[1:], len(positions)) - 1]
+    inside = coverage >= len(runs) if intersect else coverage > 0
+    before = np.concatenate(([False], inside[:-1]))
+    return unique[inside & ~before], unique[~inside & before]
+
+
+def coco_merge(rles: Sequence[CocoRle], intersect: bool = False) -> CocoRle:
+    return coco_rle(*merge_runs(tuple(coco_runs(rle) for rle in rles), intersect), rles[0]["size"])
+
+
+def covered(starts: np.ndarray, ends: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Number of pixels of sorted non-overlapping runs before each point
+    """
+
+    if len(starts) == 0:
+        return np.zeros(len(points), dtype=np.int64)
+    lengths = ends - starts
+    cumulative = np.concatenate(([0], np.cumsum(lengths)))
+    idx = np.searchsorted(starts, points, side='right') - 1
+    run = np.maximum(idx, 0)
+    return np.where(idx >= 0, cumulative[run] + np.clip(points - starts[run], 0, lengths[run]), 0)
+
+
+@timed("compute")
+def coco_iou(dts: Sequence[CocoRle],
+             gts: Sequence[CocoRle],
+             iscrowd: Optional[Sequence[bool]] = None) -> np.ndarray:
+    """
+    (D, G) matrix of IoU between detected and ground truth masks computed on runs.
+    Intersection with all ground truth masks is found by one search of their runs
+    in runs of each detected mask. As in COCO, IoU with crowd is intersection over area of detection
+
+    Parameters
+    ----------
+        dts: Sequence[CocoRle]
+            Detected masks
+
+        gts: Sequence[CocoRle]
+            Ground truth masks of the same size
+
+        iscrowd: Optional[Sequence[bool]]
+            Whether each ground truth mask is crowd region
+
+    Return
+    ------
+        iou: np.ndarray
+            IoU of each pair
+    """
+
+    gt_runs = tuple(coco_runs(rle) for rle in gts)
+    gt_areas = np.array([np.sum(ends - starts) for starts, ends in gt_runs], dtype=np.int64)
+    # Boundaries of all ground truth runs are sorted once, so searches in each detection are sequential
+    points = np.concatenate([run for starts, ends in gt_runs for run in (starts, ends)] + [np.empty(0, np.int64)])
+    signs = np.concatenate([np.full(len(run), sign) for starts, ends in gt_runs
+                            for run, sign in ((starts, -1), (ends, 1))] + [np.empty(0, np.int64)])
+    owners = np.repeat(np.arange(len(gts)), [2 * len(starts) for starts, _ in gt_runs])
+    order = np.argsort(points, kind='stable')
+    points, signs, owners = points[order], signs[order], owners[order]
+    crowd = np.zeros(len(gts), dtype=bool) if iscrowd is None else np.asarray(iscrowd, dtype=bool)
+
+    iou = np.zeros((len(dts), len(gts)), dtype=np.float64)
+    for row, rle in enumerate(dts):
+        starts, ends = coco_runs(rle)
+        dt_area = np.sum(ends - starts)
+        intersection = np.bincount(owners, weights=signs * covered(starts, ends, points), minlength=len(gts))
+        union = np.where(crowd, dt_area, dt_area + gt_areas - intersection)
+        iou[row] = np.divide(intersection, union, out=np.zeros(len(gts)), where=union > 0)
+    return iou
+
+
+@timed("decode")
+def read_mask(path: str) -> Image:
+    """
+    Decode mask as one channel, so rle covers height * width pixels
+    """
+
+    return cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+
+def encode_mask(path: str) -> Tuple[Tuple[int, int], str]:
+    """
+    Read mask in worker and return only its size and rle
+    """
+
+    mask = read_mask(path)
+    return mask.shape[:2], mask2rle(mask)
+
+
+def encode_label_map(path: str) -> Tuple[Tuple[int, int], Tuple[Tuple[int, str], ...]]:
+    mask = read_mask(path)
+    return mask.shape[:2], mask2rles(mask)
+
+
+def encode_mask_runs(path: str) -> Tuple[Tuple[int, int], np.ndarray]:
+    mask = read_mask(path)
+    return mask.shape[:2], mask2runs(mask)
+
+
+def encode_label_map_runs(path: str) -> Tuple[Tuple[int, int], Tuple[Tuple[int, np.ndarray], ...]]:
+    mask = read_mask(path)
+    return mask.shape[:2], label_map2runs(mask)
+
+
+# Function of worker for each output format and multiclass flag
+ENCODERS = {
+    (RleFormat.csv, False): encode_mask,
+    (RleFormat.csv, True): encode_label_map,
+    (RleFormat.npz, False): encode_mask_runs,
+    (RleFormat.npz, True): encode_label_map_runs,
+}
+
+
+def save_runs(filename: str,
+              names: Sequence[str],
+              shapes: Sequence[Tuple[int, int]],
+              runs: Sequence[np.ndarray],
+              classes: Optional[Sequence[int]] = None) -> None:
+    """
+    Save rles as columns of npz file: runs of all masks are concatenated into one int32 array
+    and runs of mask i are runs[offsets[i]:offsets[i + 1]]
+
+    Parameters
+    ----------
+        filename: str
+            Path to .npz file
+
+        names: Sequence[str]
+            Name of image of each mask
+
+        shapes: Sequence[Tuple[int, int]]
+            (height, width) of each mask
+
+        runs: Sequence[np.ndarray]
+            Flat one-based pairs "start length" of each mask
+
+        classes: Optional[Sequence[int]]
+            Class of each mask of label maps
+    """
+
+    offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+    np.cumsum([len(mask_runs) for mask_runs in runs], out=offsets[1:])
+    shapes = np.array(shapes, dtype=np.int32).reshape(-1, 2)
+    arrays = {
+        NAMES_ARRAY: np.array(names, dtype=str),
+        HEIGHTS_ARRAY: shapes[:, 0],
+        WIDTHS_ARRAY: shapes[:, 1],
+        RUNS_ARRAY: np.concatenate(list(runs) + [np.empty(0, dtype=np.int32)]).astype(np.int32),
+        OFFSETS_ARRAY: offsets,
+    }
+    if classes is not None:
+        arrays[CLASSES_ARRAY] = np.array(classes, dtype=np.int32)
+    np.savez(filename, **arrays)
+
+
+def load_runs(filename: str) -> Tuple[Tuple[str, ...],
+                                     Optional[Tuple[int, ...]],
+                                     Tuple[Tuple[np.ndarray, Shape], ...]]:
+    """
+    Names, classes (None without classes) and pairs of runs and shape of masks from npz
+    file created by save_runs. Runs are views of one array, nothing is parsed
+    """
+
+    with np.load(filename) as data:
+        columns = {key: data[key] for key in data.files}
+    runs = np.split(columns[RUNS_ARRAY], columns[OFFSETS_ARRAY][1:-1])
+    shapes = zip(columns[HEIGHTS_ARRAY].tolist(), columns[WIDTHS_ARRAY].tolist())
+    classes = tuple(columns[CLASSES_ARRAY].tolist()) if CLASSES_ARRAY in columns else None
+    return tuple(columns[NAMES_ARRAY].tolist()), classes, tuple(zip(runs, shapes))
+
+
+def write_csv(filename: str, img_names: Sequence[str], results: Iterable[Tuple[Any, Any]], multiclass: bool) -> None:
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(("image_name", "class", "rle", "size") if multiclass else ("image_name", "rle", "size"))
+        for img_name, (img_size, rles) in zip(img_names, results):
+            with stage("write"):
+                if multiclass:
+                    writer.writerows((img_name, label, rle, img_size) for label, rle in rles)
+                else:
+                    writer.writerow((img_name, rles, img_size))
+
+
+def write_npz(filename: str, img_names: Sequence[str], results: Iterable[Tuple[Any, Any]], multiclass: bool) -> None:
+    """
+    Runs are kept as int32 arrays until all masks are encoded and saved at once
+    """
+
+    names, classes, shapes, runs = [], [], [], []
+    for img_name, (img_size, img_runs) in zip(img_names, results):
+        for label, label_runs in (img_runs if multiclass else ((None, img_runs), )):
+            names.append(img_name)
+            classes.append(label)
+            shapes.append(img_size)
+            runs.append(label_runs)
+    with stage("write"):
+        save_runs(filename, names, shapes, runs, classes if multiclass else None)
+
+
+def write_mask(task: MaskTask) -> bool:
+    """
+    Decode and write mask in worker, so only the task and status are sent between processes
+    """
+
+    mask = decode_task(task)
+    params = [cv2.IMWRITE_PNG_COMPRESSION, task.compression] if task.compression is not None else []
+    with stage("write"):
+        return cv2.imwrite(os.path.join(task.out_dir, task.name), mask, params)
+
+
+def write_masks_npz(filename: str, tasks: Sequence[MaskTask], compression: Optional[int] = None) -> None:
+    """
+    Masks decoded by workers are written into npz file one by one as they arrive,
+    so npz with all masks is written without keeping them in memory.
+    Compression is level of deflate, masks are stored as they are without it
+    """
+
+    zip_compression = zipfile.ZIP_DEFLATED if compression else zipfile.ZIP_STORED
+    with zipfile.ZipFile(filename, 'w', compression=zip_compression, compresslevel=compression) as archive:
+        for task, mask in zip(tasks, pool_imap(decode_task, tasks)):
+            with stage("write"), archive.open(f"{task.name}.npy", 'w', force_zip64=True) as file:
+                np.lib.format.write_array(file, mask, allow_pickle=False)
 
 
 @print_delimiter("Convert masks to rle's...")
-def main_torle(imdir: str) -> None:
+def main_torle(imdir: str, multiclass: bool = False, out_format: RleFormat = RleFormat.csv) -> None:
+    """
+    Masks are read and encoded by workers, which return only rles. Csv rows are written
+    as results arrive, so masks of whole folder are never kept in memory
+    """
+
     img_names = images(imdir)
-    img_locations = (os.path.join(imdir, img) for img in img_names)
-    img_data = tuple(cv2.imread(img) for img in img_locations)
-    img_sizes = (img.shape[:2] for img in img_data)
-    rles = proces_async(img_data, mask2rle)
-    rle_result = pd.DataFrame(tuple(zip(img_names, rles, img_sizes)),
-                              columns=["image_name", 'rle', 'size'])
-    rle_result.to_csv(f"rle_of_{imdir}.csv", index=False)
+    img_locations = tuple(os.path.join(imdir, img) for img in img_names)
+    results = pool_imap(ENCODERS[RleFormat(out_format), multiclass], img_locations)
+    write = write_npz if out_format == RleFormat.npz else write_csv
+    write(f"rle_of_{imdir}.{RleFormat(out_format).value}", img_names, results, multiclass)
 
 
 @print_delimiter("Convert rle's to masks...")
 def main_frommrle(filename: str,
                   rle_column: str,
                   size_column: str,
-                  name_column: str) -> None:
-    data = pd.read_csv(filename)
-    rles = data[rle_column].value.tolist()
-    shapes = data[size_column].value.tolist()
-    images_names = data[name_column].value.tolist()
-    rle_and_shapes = tuple((rle, shape) for rle, shape in zip(rles, shapes))
-    images = proces_async(rle_and_shapes, rle2mask)
-    proces_async(zip(images_names, images), save_mask)
+                  name_column: str,
+                  class_column: Optional[str] = None,
+                  out_format: MaskFormat = MaskFormat.png,
+                  compression: Optional[int] = None) -> None:
+    """
+    Npz file of 'torle --format npz' is read without parsing, its columns are fixed
+    and masks with classes are always merged into label maps. Workers decode and write
+    masks themselves, masks of npz output are sent back to be written into one file
+    """
+
+    if filename.endswith(".npz"):
+        images_names, classes, rles_and_shapes = load_runs(filename)
+    else:
+        data = pd.read_csv(filename)
+        rles = data[rle_column].tolist()
+        shapes = data[size_column].tolist()
+        images_names = data[name_column].tolist()
+        classes = data[class_column].tolist() if class_column is not None else None
+        rles_and_shapes = tuple(zip(rles, shapes))
+    tasks = mask_tasks(images_names, classes, rles_and_shapes, compression)
+    if out_format == MaskFormat.npz:
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        write_masks_npz(f"masks_of_{stem}.npz", tasks, compression)
+        return
+    failed = [task.name for task, written in zip(tasks, pool_imap(write_mask, tasks)) if not written]
+    if failed:
+        typer.echo(f"{len(failed)} masks were not written, e.g. {failed[0]}")
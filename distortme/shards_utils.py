@@ -0,0 +1,162 @@
+import os
+import cv2
+import json
+import tarfile
+import numpy as np
+from tqdm import tqdm
+from collections import defaultdict
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from distortme.base_types import Image
+from distortme.files_utils import atomic_write, create_folders, images
+from distortme.main_utils import print_delimiter
+
+
+SHARD_NAME = "shard-{:06d}.tar"
+INDEX_NAME = "index.json"
+READ_BUFFER = 16 * 1024 * 1024
+
+
+def folder_files(imdir: str, recursive: bool = False) -> Tuple[str, ...]:
+    """
+    Images in imdir as paths relative to it. With recursive enabled
+    images from subfolders, e.g. created by 'augs', are included too.
+    """
+
+    if not recursive:
+        return tuple(sorted(images(imdir)))
+    result = []
+    for root, _, _ in os.walk(imdir):
+        rel_root = os.path.relpath(root, imdir)
+        result.extend(os.path.normpath(os.path.join(rel_root, name)) for name in images(root))
+    return tuple(sorted(result))
+
+
+class ShardWriter:
+    """
+    Pack files into tar shards of limited size and collect index of their locations
+
+    Parameters
+    ----------
+        outdir: str
+            Folder for shards and index
+
+        shard_size: int
+            Maximal size of shard in bytes. Shard holds at least one file
+    """
+
+    def __init__(self, outdir: str, shard_size: int) -> None:
+        self.outdir = outdir
+        self.shard_size = shard_size
+        self.shards: List[str] = []
+        self.entries: List[Tuple[str, int, int, int]] = []
+        self._tar: Optional[tarfile.TarFile] = None
+
+    def _next_shard(self) -> None:
+        self._close_shard()
+        self.shards.append(SHARD_NAME.format(len(self.shards)))
+        self._tar = tarfile.open(os.path.join(self.outdir, self.shards[-1] + ".tmp"), 'w',
+                                 format=tarfile.PAX_FORMAT)
+
+    def _close_shard(self) -> None:
+        if self._tar is None:
+            return
+        self._tar.close()
+        shard_path = os.path.join(self.outdir, self.shards[-1])
+        os.replace(shard_path + ".tmp", shard_path)
+        self._tar = None
+
+    def add(self, path: str, name: str) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = os.path.getsize(path)
+        info.mtime = int(os.path.getmtime(path))
+        if self._tar is None or self._tar.offset + info.size > self.shard_size:
+            if self._tar is None or self._tar.offset > 0:
+                self._next_shard()
+        header_size = len(info.tobuf(self._tar.format, self._tar.encoding, self._tar.errors))
+        data_offset = self._tar.offset + header_size
+        with open(path, 'rb') as file:
+            self._tar.addfile(info, file)
+        self.entries.append((name, len(self.shards) - 1, data_offset, info.size))
+
+    def close(self) -> None:
+        self._close_shard()
+        index = {"shards": self.shards, "entries": self.entries}
+        atomic_write(os.path.join(self.outdir, INDEX_NAME), json.dumps(index).encode())
+
+
+class ShardReader:
+    """
+    Streaming reader of shards created by 'distortme toshards'.
+    Shards are read sequentially with large buffer using offsets from index,
+    so only one pass over each file is done and tar headers are not parsed.
+
+    Parameters
+    ----------
+        path: str
+            Folder with shards and index.json
+
+        shards: Optional[Sequence[int]]
+            Ids of shards to read, e.g. to split shards between workers. All shards if None
+
+        flags: int
+            Flags passed to cv2.imdecode
+
+    Example
+    -------
+        for name, image in ShardReader("dataset_shards"):
+            ...
+    """
+
+    def __init__(self, path: str,
+                 shards: Optional[Sequence[int]] = None,
+                 flags: int = cv2.IMREAD_COLOR) -> None:
+        self.path = path
+        self.flags = flags
+        with open(os.path.join(path, INDEX_NAME), 'r') as file:
+            index = json.load(file)
+        self.shards = tuple(index["shards"])
+        self.shard_ids = tuple(range(len(self.shards))) if shards is None else tuple(shards)
+        selected = frozenset(self.shard_ids)
+        self.entries = {name: (shard, offset, size)
+                        for name, shard, offset, size in index["entries"] if shard in selected}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _decode(self, data: bytes) -> Image:
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self.flags)
+
+    def __iter__(self) -> Iterator[Tuple[str, Image]]:
+        by_shard = defaultdict(list)
+        for name, (shard_id, offset, size) in self.entries.items():
+            by_shard[shard_id].append((offset, size, name))
+        for shard_id in self.shard_ids:
+            path = os.path.join(self.path, self.shards[shard_id])
+            with open(path, 'rb', buffering=READ_BUFFER) as file:
+                position = 0
+                for offset, size, name in sorted(by_shard[shard_id]):
+                    file.read(offset - position)
+                    yield name, self._decode(file.read(size))
+                    position = offset + size
+
+    def read(self, name: str) -> Image:
+        """
+        Random access to one file by its name using offsets from index
+        """
+
+        shard_id, offset, size = self.entries[name]
+        with open(os.path.join(self.path, self.shards[shard_id]), 'rb') as file:
+            file.seek(offset)
+            return self._decode(file.read(size))
+
+
+@print_delimiter("Pack files to tar shards...")
+def main_to_shards(imdir: str, outdir: Optional[str], shard_mb: int, recursive: bool) -> None:
+    if outdir is None:
+        outdir = os.path.normpath(imdir) + "_shards"
+    create_folders((outdir, ))
+    writer = ShardWriter(outdir, shard_mb * 1024 * 1024)
+    for name in tqdm(folder_files(imdir, recursive), ncols=80):
+        writer.add(os.path.join(imdir, name), name)
+    writer.close()
@@ -1,6 +1,5 @@
 import os
 import shutil
-import multiprocessing as mp
 from collections import defaultdict
 from typing import List, Tuple, Dict
 
@@ -9,6 +8,7 @@ from frozendict import frozendict
 
 from distortme.files_utils import full_path, images, create_folders
 from distortme.main_utils import print_delimiter
+from distortme.pool_utils import pool_map
 
 
 class CopyTo:
@@ -35,9 +35,8 @@ def copy_files_to_folders(files: List[str], path_to_save: str) -> None:
             filename = os.path.basename(file)
             shutil.copy(file, os.path.join(path_to_save, filename))
     else:
-        pool = mp.Pool(mp.cpu_count())
         copy_fn = CopyTo(path_to_save)
-        pool.map(copy_fn, files)
+        pool_map(copy_fn, files)
 
 
 def move_files_to_folders(files: List[str], path_to_save: str) -> None:
@@ -46,9 +45,8 @@ def move_files_to_folders(files: List[str], path_to_save: str) -> None:
             filename = file.split('/')[-1]
             shutil.move(file, os.path.join(path_to_save, filename))
     else:
-        pool = mp.Pool(mp.cpu_count())
         copy_fn = MoveTo(path_to_save)
-        pool.map(copy_fn, files)
+        pool_map(copy_fn, files)
 
 
 def map_classes_to_files(files: Tuple[str, ...], descriptors: Tuple[str, ...], imdir: str) -> Dict[str, List[str]]: